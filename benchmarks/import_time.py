@@ -0,0 +1,67 @@
+"""Guard the cold-start latency of `qweather`, `where_sunshine` and the CLI.
+
+Every module is imported in a fresh interpreter several times. The script
+exits with status 1 when the median import time exceeds its budget or when
+a heavy dependency is loaded eagerly.
+
+Usage:
+    python benchmarks/import_time.py [--repeat 5] [--scale 1.0]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module: (budget in milliseconds, modules that must not be loaded by the import)
+TARGETS = {
+    "qweather": (10, ["requests", "qweather.weather_api.api"]),
+    "qweather.weather_api": (10, ["requests", "qweather.weather_api.api"]),
+    "where_sunshine": (40, ["requests", "rich.progress", "qweather.weather_api.api"]),
+    "cli_demo": (50, ["requests", "rich.table", "rich.progress"]),
+}
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure(module, repeat):
+    timings, loaded = [], set()
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module)],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        probe = json.loads(output)
+        timings.append(probe["ms"])
+        loaded.update(probe["modules"])
+    return statistics.median(timings), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget, e.g. on slow machines.")
+    args = parser.parse_args()
+
+    failed = False
+    for module, (budget, forbidden) in TARGETS.items():
+        median, loaded = measure(module, args.repeat)
+        eager = [name for name in forbidden if name in loaded]
+        ok = median <= budget * args.scale and not eager
+        failed = failed or not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {module:<22} {median:7.1f} ms (budget {budget * args.scale:.0f} ms)"
+              + (f", eagerly loads {', '.join(eager)}" if eager else ""))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,21 @@
 import qweather
-from rich.table import Table
+from qweather.utils import concurrency, tracing
 from rich import print
-from rich.text import Text
-from rich.style import Style
 from where_sunshine import sunshine_finder
+from where_sunshine.sunshine_finder import location_to_cities
 from where_sunshine.utils import GeoMap as geo_map
+from where_sunshine.utils import format_date, match_weather
+from where_sunshine.weather_server import normalize_days
 
+import argparse
+import csv
+import json
+import os
 import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
 SUMMARY_TEMPLATE = """
 🎉 {start_date} 至 {end_date} 期间，{location}共有 {num_cities} 个城市为 ☀️ 晴或 ⛅ 多云天气。
@@ -15,12 +24,18 @@ SUMMARY_TEMPLATE = """
 
 WEATHER_TEXT_TEMPLATE = """{weather_emoji} {weather_text} ({min_temp}~{max_temp} ℃ )"""
 
+CSV_FIELDS = ["query", "region", "province", "city", "date", "weather", "tempMin", "tempMax", "link"]
+
 
 def display_help():
+    from rich.table import Table
+    from rich.text import Text
+
     print("你可以输入 📍 “位置” ☀️ “天气” 🔢 “日期” 的任意组合来查找晴天")
     print("同类型变量可以输入多个，用空格分割；不同类型变量依顺序输入用逗号分割")
     print(Text("注意：你的输入必须包含三个逗号来分割参数", style="red"))
     print("(👉 输入“help”显示此帮助消息或输入“exit”退出)")
+    print("(⏳ 查询在后台运行，可以继续输入；输入“jobs”查看进行中的查询，“cancel [编号]”或 Ctrl-C 取消查询)")
     table = Table()
     table.add_column("变量", style="magenta")
     table.add_column("有效输入", style="bright_cyan")
@@ -117,10 +132,118 @@ def format_weather_text(day_weather):
     )
 
 
-def display_result(params):
-    cities_weather = fetch_weather(params)
-    print(summary(cities_weather, params[0]))
-    
+class Session:
+    r"""Interactive session running every query as a background task.
+
+    The prompt stays usable while queries run. Matching cities are printed
+    as they are fetched, and the full tables once the query is done.
+    Cancelling a query stops its upstream requests that have not been sent
+    yet; the forecasts already fetched stay in the `sunshine_finder` cache,
+    so repeating the query only fetches the rest.
+
+    Args:
+        profile (Optional[str]): Directory of the per-query trace files, see
+            `report_profile`.
+        max_queries (int): Number of queries running at the same time.
+    """
+
+    prompt = "WhereSunshine: "
+
+    def __init__(self, profile=None, max_queries=4):
+        self.profile = profile
+        self.executor = ThreadPoolExecutor(max_workers=max_queries, thread_name_prefix="query")
+        self.tasks = {}  #: Task number to `(query, future, cancel event)`
+        self.count = 0
+        self._lock = threading.Lock()
+        self._output = threading.Lock()
+
+    def submit(self, query, params) -> int:
+        cancelled = threading.Event()
+        with self._lock:
+            self.count += 1
+            number = self.count
+            future = self.executor.submit(self._run, number, query, params, cancelled)
+            self.tasks[number] = (query, future, cancelled)
+        future.add_done_callback(lambda _: self._forget(number))
+        return number
+
+    def running(self) -> dict:
+        with self._lock:
+            return {number: task[0] for number, task in self.tasks.items()}
+
+    def cancel(self, number=None) -> list:
+        """Cancel a query, or every running query when `number` is None, and return the cancelled numbers."""
+        with self._lock:
+            numbers = list(self.tasks) if number is None else [number] if number in self.tasks else []
+            for task_number in numbers:
+                self.tasks[task_number][2].set()
+        return numbers
+
+    def close(self):
+        self.cancel()
+        self.executor.shutdown(wait=True)
+
+    def _run(self, number, query, params, cancelled):
+        from rich.text import Text
+
+        try:
+            with concurrency.cancel_scope(cancelled), tracing.tags(task=number):
+                with tracing.span("cli.fetch", query=params):
+                    cities_weather = fetch_weather(params, self._streamer(number, params))
+                with self._output:
+                    print(Text(f"\n[#{number}] {query}", style="bold"))
+                    with tracing.span("cli.render"):
+                        render_result(cities_weather, params[0])
+                    print(self.prompt, end="", flush=True)
+        except concurrency.Cancelled:
+            self._print(Text(f"[#{number}] 已取消: {query}（已获取的数据保留在缓存中）", style="yellow"))
+        except Exception as e:
+            self._print(Text(f"[#{number}] 查询失败: {query}\n{e}", style="red"))
+        finally:
+            if self.profile is not None:
+                name = f"{datetime.now():%Y%m%d%H%M%S}-{number}"
+                with self._output:
+                    report_profile(self.profile, name, tracing.take(task=number))
+
+    def _streamer(self, number, params):
+        """Return a callback printing a fetched city as soon as it matches the query."""
+        from rich.text import Text
+
+        _, weather, date = params
+        weathers = [weather for weather in weather.split(" ") if weather in ("晴", "多云")]
+        dates = {day.isoformat() for day in format_date(date)}
+
+        def stream(city, daily_weather):
+            days = [
+                day_weather for day_weather in daily_weather["daily"]
+                if day_weather["date"] in dates
+                and any(match_weather(day_weather["weather"], weather) for weather in weathers)
+            ]
+            if days:
+                text = "，".join(f"{day_weather['date'][5:]} {format_weather_text(day_weather)}" for day_weather in days)
+                with self._output:
+                    print(Text(f"\r[#{number}] {city}: {text}"))
+                    print(self.prompt, end="", flush=True)
+
+        return stream
+
+    def _print(self, message):
+        with self._output:
+            print(message)
+            print(self.prompt, end="", flush=True)
+
+    def _forget(self, number):
+        with self._lock:
+            self.tasks.pop(number, None)
+
+
+def render_result(cities_weather, location):
+    from rich.style import Style
+    from rich.table import Table
+    from rich.text import Text
+
+    print(summary(cities_weather, location))
+
     cities_weather = restructure(cities_weather)
     for region, provinces in cities_weather.items():
         table = Table(title=region)
@@ -166,7 +289,17 @@ def parse_query(query: str):
     )
 
 
-def fetch_weather(query):
+def validate_query(params):
+    """Raise ValueError unless every location and the date of a parsed query are valid."""
+    location, _, date = params
+    for location in location.split(" "):
+        location_to_cities(location, sunshine_finder.tier)
+    if not format_date(date):
+        raise ValueError(f"Invalid date: {date}")
+    normalize_days(date)
+
+
+def fetch_weather(query, callback=None):
     location, weather, date = query
     locations = location.split(" ")
     weathers = weather.split(" ")
@@ -174,33 +307,191 @@ def fetch_weather(query):
 
     for location in locations:
         for weather in weathers:
-            if weather == "晴":
-                result.update(sunshine_finder.sunny_cities(location, date))
-            elif weather == "多云":
-                result.update(sunshine_finder.cloudy_cities(location, date))
+            if weather in ("晴", "多云"):
+                result.update(sunshine_finder.view(location, weather, date, callback).result)
     return result
 
 
-def main():
+def report_profile(directory, name, events=None):
+    """Dump the recorded spans as a Chrome trace and print the per-stage table to stderr.
+
+    Reports every recorded span, or only `events` (e.g. those of one query, see `tracing.take`).
+    """
+    from rich.console import Console
+    from rich.table import Table
+
+    if events is None:
+        events = tracing.reset()
+    path = os.path.join(directory, f"wheresunshine-trace-{name}.json")
+    tracing.dump(path, events)
+
+    table = Table(title=f"Profile ({path})")
+    table.add_column("阶段", style="cyan")
+    table.add_column("次数", justify="right")
+    table.add_column("总计 ms", justify="right")
+    table.add_column("平均 ms", justify="right")
+    table.add_column("最大 ms", justify="right")
+    for stage, stats in tracing.summary(events).items():
+        table.add_row(
+            stage,
+            str(stats["count"]),
+            f"{stats['total_ms']:.1f}",
+            f"{stats['mean_ms']:.1f}",
+            f"{stats['max_ms']:.1f}",
+        )
+    Console(stderr=True).print(table)
+
+
+def iter_rows(query, params):
+    """Yield one flat row per city and day of a query result."""
+    for city, daily_weather in fetch_weather(params).items():
+        region = geo_map.city_to_region(city)
+        province = geo_map.city_to_province(city)
+        for day_weather in daily_weather["daily"]:
+            yield {
+                "query": query,
+                "region": region,
+                "province": province,
+                "city": city,
+                "date": day_weather["date"],
+                "weather": day_weather["weather"],
+                "tempMin": day_weather["tempMin"],
+                "tempMax": day_weather["tempMax"],
+                "link": daily_weather["link"],
+            }
+
+
+def batch(queries, output_format="ndjson", output=sys.stdout):
+    """Answer many queries non-interactively and stream the rows to `output`.
+
+    All queries are planned together: the forecasts of every city they
+    touch are fetched once, for the whole period they span, and each query
+    is then answered from the shared cache.
+    """
+    parsed = []
+    for query in queries:
+        try:
+            params = parse_query(query)
+            if params is not None:
+                validate_query(params)
+        except ValueError:
+            params = None
+        if params is None:
+            sys.stderr.write(f"无效的输入: {query}\n")
+        else:
+            parsed.append((query, params))
+
+    plan = [
+        (location, date)
+        for _, (location, _, date) in parsed
+        for location in location.split(" ")
+    ]
+    sunshine_finder.prefetch(plan)
+
+    writer = None
+    if output_format == "csv":
+        writer = csv.DictWriter(output, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+    for query, params in parsed:
+        with tracing.span("cli.query", query=query):
+            for row in iter_rows(query, params):
+                if writer is not None:
+                    writer.writerow(row)
+                else:
+                    output.write(json.dumps(row, ensure_ascii=False) + "\n")
+            output.flush()
+
+
+def read_queries(args):
+    queries = list(args.queries)
+    if args.file is not None:
+        with (sys.stdin if args.file == "-" else open(args.file, "r", encoding="utf-8")) as f:
+            queries.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    return queries
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="WhereSunshine: 寻找晴天城市")
+    parser.add_argument("queries", nargs="*", help="“位置，天气，日期” 格式的查询，不提供时进入交互模式")
+    parser.add_argument("-f", "--file", help="从文件读取查询，每行一个，`-` 表示标准输入")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson", help="批量模式的输出格式")
+    parser.add_argument(
+        "--profile", nargs="?", const=".", metavar="DIR",
+        help="记录每次查询各阶段耗时，输出 Chrome trace 文件到 DIR（默认当前目录）并打印汇总表",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from rich.text import Text
+
+    args = parse_args(argv)
+    if args.profile is not None:
+        tracing.enable()
+    queries = read_queries(args)
+    if queries:
+        if qweather.api_key is None:
+            sys.exit("api_key not provided, you could provide it with `shell: export QWEATHER_API_KEY=xxx`")
+        with tracing.span("cli.batch", queries=len(queries)):
+            batch(queries, args.format)
+        if args.profile is not None:
+            report_profile(args.profile, "batch")
+        return
+
     if qweather.api_key is None:
         qweather.api_key = input("Please set your QWeather API key first: ")
         
     clear_cli()
     print("嗨 👋，在寻找晴天吗？\n")
     display_help()
-    while True:
-        query = input("WhereSunshine: ")
-        if query == "exit":
-            break
-        elif query == "help":
-            display_help()
-        else:
-            params = parse_query(query)
-            if params is None:
-                print(f"无效的输入: {query}")
-                print(Text("注意：你的输入必须包含三个逗号来分割参数", style="red"))
+    # Progress bars of concurrent queries would garble the prompt.
+    sunshine_finder.progress = False
+    session = Session(args.profile)
+    try:
+        while True:
+            try:
+                query = input(Session.prompt).strip()
+            except KeyboardInterrupt:
+                cancelled = session.cancel()
+                if not cancelled:
+                    print()
+                    break
+                print(f"\n正在取消 {len(cancelled)} 个查询...")
+                continue
+            except EOFError:
+                break
+            if query == "exit":
+                break
+            elif query == "":
+                continue
+            elif query == "help":
+                display_help()
+            elif query == "jobs":
+                running = session.running()
+                if not running:
+                    print("没有进行中的查询")
+                for number, running_query in running.items():
+                    print(Text(f"[#{number}] {running_query}"))
+            elif query.split(" ")[0] == "cancel":
+                number = query.split(" ")[1] if len(query.split(" ")) > 1 else None
+                if number is not None and not number.lstrip("#").isdigit():
+                    print(f"无效的查询编号: {number}")
+                elif not session.cancel(None if number is None else int(number.lstrip("#"))):
+                    print("没有可以取消的查询")
             else:
-                display_result(params)
+                try:
+                    params = parse_query(query)
+                    if params is not None:
+                        validate_query(params)
+                except ValueError:
+                    params = None
+                if params is None:
+                    print(f"无效的输入: {query}")
+                    print(Text("注意：你的输入必须包含三个逗号来分割参数", style="red"))
+                else:
+                    print(Text(f"[#{session.submit(query, params)}] 已开始查询"))
+    finally:
+        session.close()
 
 
 if __name__ == "__main__":
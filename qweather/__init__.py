@@ -1,4 +1,5 @@
 import os
+from importlib import import_module
 
 __all__ = [
     "city_lookup_api",
@@ -30,35 +31,6 @@ __all__ = [
     "astronomy_solar_elevation_angle_api"
 ]
 
-from .weather_api import (
-    city_lookup_api,
-    top_city_api,
-    poi_lookup_api,
-    poi_range_api,
-    now_weather_api,
-    daily_weather_api,
-    hour_weather_api,
-    minutely_precipitation_api,
-    grid_now_weather_api,
-    grid_daily_weather_api,
-    grid_hour_weather_api,
-    warning_weather_api,
-    warning_city_list_api,
-    weather_indices_api,
-    aqi_now_api,
-    aqi_daily_api,
-    historical_aqi_api,
-    historical_weather_api,
-    typhoon_forecast_api,
-    typhoon_track_api,
-    typhoon_list_api,
-    ocean_tide_api,
-    ocean_currents_api,
-    solar_radiation_hour_api,
-    astronomy_sun_api,
-    astronomy_moon_api,
-    astronomy_solar_elevation_angle_api,
-)
 
 
 api_key = os.environ.get("QWEATHER_API_KEY")
@@ -66,3 +38,19 @@ api_key = os.environ.get("QWEATHER_API_KEY")
 
 weather_api_url = os.environ.get("WEATHER_API_URL", "https://devapi.qweather.com/v7")
 geo_api_url = os.environ.get("GEO_API_URL", "https://geoapi.qweather.com/v2")
+
+# Answer the astronomy APIs locally for "lon,lat" locations, see `qweather.astronomy`.
+local_astronomy = os.environ.get("QWEATHER_LOCAL_ASTRONOMY", "").lower() in ("1", "true")
+
+
+def __getattr__(name):
+    # API clients are loaded on first access to keep `import qweather` cheap.
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(".weather_api", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
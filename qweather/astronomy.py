@@ -0,0 +1,295 @@
+# -*- coding:utf-8 -*-
+r"""Local sun and moon engine compatible with the QWeather Astronomy APIs.
+
+Sunrise, sunset, solar elevation and moon phase only depend on coordinates
+and time, so they can be computed offline instead of spending quota. The
+sun uses the NOAA general solar position equations (about one minute of
+accuracy), the moon a low-precision analytic lunar theory. Set
+`qweather.local_astronomy = True` (or `export QWEATHER_LOCAL_ASTRONOMY=1`)
+to make `astronomy_sun_api`, `astronomy_moon_api` and
+`astronomy_solar_elevation_angle_api` answer locally whenever the location
+is given as `"lon,lat"` coordinates.
+
+Example:
+    .. code-block:: python
+        from qweather import astronomy
+
+        astronomy.sun(location="116.41,39.92", date="20240623")
+        astronomy.daylight_hours([(116.41, 39.92), (121.47, 31.23)], ["20240623", "20240624"])
+"""
+import math
+from datetime import date as date_type
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+SUN_ALTITUDE = -0.833  #: Sun altitude at rise/set, refraction and radius included
+MOON_ALTITUDE = 0.125  #: Moon altitude at rise/set, parallax and radius included
+SYNODIC_MONTH = 29.530588853
+KNOWN_NEW_MOON = 2451550.1  #: Julian day of the new moon on 2000-01-06
+MOON_PHASES = [
+    ("新月", "800"),
+    ("蛾眉月", "801"),
+    ("上弦月", "802"),
+    ("盈凸月", "803"),
+    ("满月", "804"),
+    ("亏凸月", "805"),
+    ("下弦月", "806"),
+    ("残月", "807"),
+]
+REFER = {"sources": ["local"], "license": []}
+
+DateLike = Union[str, date_type]
+
+
+def parse_coordinates(location) -> Optional[Tuple[float, float]]:
+    """Return `(lon, lat)` of a `"lon,lat"` location, or None for a location ID."""
+    if not isinstance(location, str) or "," not in location:
+        return None
+    try:
+        lon, lat = (float(value) for value in location.split(","))
+    except ValueError:
+        return None
+    return lon, lat
+
+
+def sun(location: str, date: DateLike, tz: Optional[str] = None, **kwargs) -> Optional[Dict]:
+    """Sunrise and sunset, in the response format of `AstronomySunAPI`."""
+    coordinates = parse_coordinates(location)
+    if coordinates is None:
+        return None
+    offset = _parse_tz(tz)
+    day = _parse_date(date)
+    sunrise, sunset = _sun_times(coordinates[0], coordinates[1], _solar_terms(day))
+    polar = not 0 < sunset - sunrise < 1440
+    return {
+        "code": "200",
+        "updateTime": _format_time(datetime.now(offset)),
+        "fxLink": "",
+        "sunrise": "" if polar else _format_minutes(day, sunrise, offset),
+        "sunset": "" if polar else _format_minutes(day, sunset, offset),
+        "refer": REFER,
+    }
+
+
+def solar_elevation_angle(
+    location: str,
+    date: DateLike,
+    time: str,
+    tz: Optional[str] = None,
+    **kwargs,
+) -> Optional[Dict]:
+    """Solar elevation, in the response format of `AstronomySolarElevationAngleAPI`.
+
+    Args:
+        location (str): `"lon,lat"` coordinates.
+        date (Union[str, date]): Date in `YYYYMMDD` format.
+        time (str): Local time in `HHmm` format.
+        tz (Optional[str]): Timezone offset such as `"0800"` or `"-0530"`.
+            Defaults to China Standard Time.
+    """
+    coordinates = parse_coordinates(location)
+    if coordinates is None:
+        return None
+    lon, lat = coordinates
+    offset = _parse_tz(tz)
+    day = _parse_date(date)
+    minutes = int(time[:2]) * 60 + int(time[2:4])
+    gamma = 2 * math.pi / 365 * (day.timetuple().tm_yday - 1 + (minutes / 60 - 12) / 24)
+    eqtime, decl = _equation_of_time(gamma), _declination(gamma)
+
+    true_solar_time = (minutes + eqtime + 4 * lon - offset.utcoffset(None).total_seconds() / 60) % 1440
+    hour_angle = true_solar_time / 4 - 180
+    elevation, azimuth = _horizontal(math.radians(lat), decl, math.radians(hour_angle))
+    return {
+        "code": "200",
+        "solarElevationAngle": f"{elevation:.2f}",
+        "solarAzimuthAngle": f"{azimuth:.2f}",
+        "solarHour": f"{int(true_solar_time // 60):02d}{int(true_solar_time % 60):02d}",
+        "hourAngle": f"{hour_angle:.2f}",
+        "refer": REFER,
+    }
+
+
+def moon(location: str, date: DateLike, tz: Optional[str] = None, **kwargs) -> Optional[Dict]:
+    """Moonrise, moonset and hourly moon phase, in the response format of `AstronomyMoonAPI`."""
+    coordinates = parse_coordinates(location)
+    if coordinates is None:
+        return None
+    lon, lat = coordinates
+    offset = _parse_tz(tz)
+    day = _parse_date(date)
+    start = datetime.combine(day, datetime.min.time(), offset)
+
+    # Sample the lunar altitude every 10 minutes and interpolate the crossings.
+    step = 10
+    moonrise = moonset = ""
+    previous = _moon_altitude(start, lon, lat)
+    for minute in range(step, 1440 + step, step):
+        altitude = _moon_altitude(start + timedelta(minutes=minute), lon, lat)
+        crossing = (minute - step) + step * (MOON_ALTITUDE - previous) / (altitude - previous) \
+            if (previous - MOON_ALTITUDE) * (altitude - MOON_ALTITUDE) < 0 else None
+        if crossing is not None and crossing < 1440:
+            if altitude > previous and not moonrise:
+                moonrise = _format_time(start + timedelta(minutes=round(crossing)))
+            elif altitude < previous and not moonset:
+                moonset = _format_time(start + timedelta(minutes=round(crossing)))
+        previous = altitude
+
+    moon_phase = []
+    for hour in range(24):
+        moment = start + timedelta(hours=hour)
+        value = _moon_phase(moment)
+        name, icon = MOON_PHASES[_phase_index(value)]
+        moon_phase.append({
+            "fxTime": _format_time(moment),
+            "value": f"{value:.2f}",
+            "illumination": f"{round((1 - math.cos(2 * math.pi * value)) / 2 * 100)}",
+            "name": name,
+            "icon": icon,
+        })
+    return {
+        "code": "200",
+        "updateTime": _format_time(datetime.now(offset)),
+        "fxLink": "",
+        "moonrise": moonrise,
+        "moonset": moonset,
+        "moonPhase": moon_phase,
+        "refer": REFER,
+    }
+
+
+def daylight_hours(
+    coordinates: Sequence[Tuple[float, float]],
+    dates: Sequence[DateLike],
+) -> List[List[float]]:
+    """Daylight hours of every location on every date.
+
+    The solar terms depend on the date only, so they are computed once per
+    date and shared by all locations.
+
+    Args:
+        coordinates (Sequence[Tuple[float, float]]): `(lon, lat)` pairs.
+        dates (Sequence[Union[str, date]]): Dates in `YYYYMMDD` format or `date` objects.
+
+    Returns:
+        List[List[float]]: `result[i][j]` is the daylight of `coordinates[i]` on `dates[j]`.
+    """
+    terms = [_solar_terms(_parse_date(day)) for day in dates]
+    return [
+        [round((sunset - sunrise) / 60, 2) for sunrise, sunset in (_sun_times(lon, lat, term) for term in terms)]
+        for lon, lat in coordinates
+    ]
+
+
+def _solar_terms(day: date_type) -> Tuple[float, float]:
+    gamma = 2 * math.pi / 365 * (day.timetuple().tm_yday - 1)
+    return _equation_of_time(gamma), _declination(gamma)
+
+
+def _equation_of_time(gamma: float) -> float:
+    return 229.18 * (
+        0.000075
+        + 0.001868 * math.cos(gamma)
+        - 0.032077 * math.sin(gamma)
+        - 0.014615 * math.cos(2 * gamma)
+        - 0.040849 * math.sin(2 * gamma)
+    )
+
+
+def _declination(gamma: float) -> float:
+    return (
+        0.006918
+        - 0.399912 * math.cos(gamma)
+        + 0.070257 * math.sin(gamma)
+        - 0.006758 * math.cos(2 * gamma)
+        + 0.000907 * math.sin(2 * gamma)
+        - 0.002697 * math.cos(3 * gamma)
+        + 0.00148 * math.sin(3 * gamma)
+    )
+
+
+def _sun_times(lon: float, lat: float, terms: Tuple[float, float]) -> Tuple[float, float]:
+    """Return sunrise and sunset in UTC minutes of the day (0 and 0, or 0 and 1440 at the poles)."""
+    eqtime, decl = terms
+    phi = math.radians(lat)
+    cos_ha = (math.sin(math.radians(SUN_ALTITUDE)) - math.sin(phi) * math.sin(decl)) / (
+        math.cos(phi) * math.cos(decl)
+    )
+    if cos_ha >= 1:  # polar night
+        return 0.0, 0.0
+    if cos_ha <= -1:  # midnight sun
+        return 0.0, 1440.0
+    ha = math.degrees(math.acos(cos_ha))
+    return 720 - 4 * (lon + ha) - eqtime, 720 - 4 * (lon - ha) - eqtime
+
+
+def _horizontal(phi: float, decl: float, hour_angle: float) -> Tuple[float, float]:
+    """Return elevation and azimuth (clockwise from north) in degrees."""
+    sin_elevation = math.sin(phi) * math.sin(decl) + math.cos(phi) * math.cos(decl) * math.cos(hour_angle)
+    elevation = math.asin(max(-1.0, min(1.0, sin_elevation)))
+    azimuth = math.degrees(math.atan2(
+        math.sin(hour_angle),
+        math.cos(hour_angle) * math.sin(phi) - math.tan(decl) * math.cos(phi),
+    )) + 180
+    return math.degrees(elevation), azimuth % 360
+
+
+def _julian_day(moment: datetime) -> float:
+    return moment.timestamp() / 86400 + 2440587.5
+
+
+def _moon_altitude(moment: datetime, lon: float, lat: float) -> float:
+    d = _julian_day(moment) - 2451545.0
+    mean_lon = math.radians(218.316 + 13.176396 * d)
+    anomaly = math.radians(134.963 + 13.064993 * d)
+    distance = math.radians(93.272 + 13.229350 * d)
+    ecl_lon = mean_lon + math.radians(6.289) * math.sin(anomaly)
+    ecl_lat = math.radians(5.128) * math.sin(distance)
+
+    obliquity = math.radians(23.439 - 0.0000004 * d)
+    ra = math.atan2(
+        math.sin(ecl_lon) * math.cos(obliquity) - math.tan(ecl_lat) * math.sin(obliquity),
+        math.cos(ecl_lon),
+    )
+    decl = math.asin(
+        math.sin(ecl_lat) * math.cos(obliquity)
+        + math.cos(ecl_lat) * math.sin(obliquity) * math.sin(ecl_lon)
+    )
+    sidereal = math.radians((280.46061837 + 360.98564736629 * d + lon) % 360)
+    elevation, _ = _horizontal(math.radians(lat), decl, sidereal - ra)
+    return elevation
+
+
+def _moon_phase(moment: datetime) -> float:
+    return ((_julian_day(moment) - KNOWN_NEW_MOON) / SYNODIC_MONTH) % 1
+
+
+def _phase_index(value: float) -> int:
+    # Principal phases are instants, so they only cover a narrow band around them.
+    for index, center in ((0, 0.0), (2, 0.25), (4, 0.5), (6, 0.75)):
+        if abs((value - center + 0.5) % 1 - 0.5) < 0.5 / SYNODIC_MONTH:
+            return index
+    return 2 * int(value * 4) + 1
+
+
+def _parse_date(day: DateLike) -> date_type:
+    if isinstance(day, date_type):
+        return day
+    return datetime.strptime(day, "%Y%m%d").date()
+
+
+def _parse_tz(tz: Optional[str]) -> timezone:
+    if not tz:
+        return timezone(timedelta(hours=8))
+    sign = -1 if tz.startswith("-") else 1
+    tz = tz.lstrip("+-")
+    return timezone(sign * timedelta(hours=int(tz[:2]), minutes=int(tz[2:4] or 0)))
+
+
+def _format_time(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M") + moment.strftime("%z")[:3] + ":" + moment.strftime("%z")[3:]
+
+
+def _format_minutes(day: date_type, utc_minutes: float, offset: timezone) -> str:
+    moment = datetime.combine(day, datetime.min.time(), timezone.utc) + timedelta(minutes=round(utc_minutes))
+    return _format_time(moment.astimezone(offset))
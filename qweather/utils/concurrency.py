@@ -0,0 +1,262 @@
+# -*- coding:utf-8 -*-
+import contextlib
+import threading
+import time
+from typing import Dict, Optional
+
+MAX_CONCURRENCY = 32
+
+_scope = threading.local()
+
+
+class Cancelled(Exception):
+    """The query of a request was cancelled before the request was sent."""
+
+
+class AdaptiveLimiter:
+    r"""AIMD (additive increase, multiplicative decrease) concurrency limiter.
+
+    The limit grows by `increase` per `limit` healthy responses and is cut by
+    `decrease` when the upstream throttles (429), fails (500) or the latency
+    rises well above the best latency seen so far.
+
+    The limit is cut at most once per congestion window: `acquire` returns
+    the current window, and only a request sent after the last cut can cut
+    the limit again, so a burst of 429s of requests in flight halves it once.
+
+    Args:
+        initial (int): Initial number of in-flight requests.
+        minimum (int): Lower bound of the limit.
+        maximum (int): Upper bound of the limit.
+        increase (float): Additive step applied after a healthy response.
+        decrease (float): Multiplicative factor applied on congestion.
+        latency_tolerance (float):
+            A response slower than `latency_tolerance` times the baseline
+            latency is treated as congestion.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = MAX_CONCURRENCY,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self.baseline_latency = None  #: Best smoothed latency observed
+        self.latency = None  #: Smoothed latency (EWMA)
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+        self.window = 0  #: Incremented by every cut of the limit
+        self._cond = threading.Condition()
+
+    def acquire(self, cancelled: Optional[threading.Event] = None) -> int:
+        """Wait for a free slot and return the congestion window, to pass to `release`.
+
+        Raises `Cancelled` once `cancelled` is set, without taking a slot.
+        """
+        with self._cond:
+            while True:
+                if cancelled is not None and cancelled.is_set():
+                    raise Cancelled()
+                if self.in_flight < int(self.limit):
+                    break
+                # Waiters of a cancellable query wake up periodically to notice the cancellation.
+                self._cond.wait(None if cancelled is None else 0.1)
+            self.in_flight += 1
+            return self.window
+
+    def release(self, latency: float, status: str = "ok", window: Optional[int] = None):
+        """Release a slot and adjust the limit.
+
+        Args:
+            latency (float): Request latency in seconds.
+            status (str): One of "ok", "throttled" or "error".
+            window (Optional[int]): The window returned by `acquire`. Defaults
+                to the current window.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            window = self.window if window is None else window
+            if status == "ok":
+                self.successes += 1
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                if self.baseline_latency is None or self.latency < self.baseline_latency:
+                    self.baseline_latency = self.latency
+                if self.latency > self.baseline_latency * self.latency_tolerance:
+                    self._backoff(window)
+                else:
+                    self.limit = min(self.maximum, self.limit + self.increase / max(self.limit, 1.0))
+            else:
+                if status == "throttled":
+                    self.throttled += 1
+                else:
+                    self.errors += 1
+                self._backoff(window)
+            self._cond.notify_all()
+
+    def abandon(self):
+        """Release a slot whose request was not sent, without adjusting the limit."""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def _backoff(self, window: int):
+        if window < self.window:
+            # Sent before the last cut, the congestion is already accounted for.
+            return
+        self.window += 1
+        self.limit = max(float(self.minimum), self.limit * self.decrease)
+        # The smoothed latency restarts from the next response of the new window.
+        self.latency = None
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "latency": self.latency,
+                "baseline_latency": self.baseline_latency,
+                "successes": self.successes,
+                "throttled": self.throttled,
+                "errors": self.errors,
+            }
+
+
+class CancelEvent(threading.Event):
+    """A cancellation event that is also set once its parent event is set."""
+
+    def __init__(self, parent: Optional[threading.Event] = None):
+        super().__init__()
+        self.parent = parent
+
+    def is_set(self) -> bool:
+        return super().is_set() or (self.parent is not None and self.parent.is_set())
+
+
+class CircuitBreaker:
+    r"""Pause an endpoint after repeated failures.
+
+    The breaker opens after `failure_threshold` consecutive failures and
+    rejects requests for `reset_timeout` seconds. Afterwards a single probe
+    request is let through (half-open); its outcome closes or re-opens the
+    breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+class EndpointController:
+    """Adaptive limiter and circuit breaker of a single endpoint."""
+
+    def __init__(self):
+        self.limiter = AdaptiveLimiter(**limiter_config)
+        self.breaker = CircuitBreaker(**breaker_config)
+
+    def snapshot(self) -> Dict:
+        return {**self.limiter.snapshot(), "breaker": self.breaker.snapshot()}
+
+
+limiter_config: Dict = {}  #: Keyword arguments of new `AdaptiveLimiter` objects
+breaker_config: Dict = {}  #: Keyword arguments of new `CircuitBreaker` objects
+
+_controllers: Dict[str, EndpointController] = {}
+_controllers_lock = threading.Lock()
+
+
+def controller(endpoint: str) -> EndpointController:
+    with _controllers_lock:
+        if endpoint not in _controllers:
+            _controllers[endpoint] = EndpointController()
+        return _controllers[endpoint]
+
+
+def stats(endpoint: Optional[str] = None) -> Dict:
+    """Return the controller state of an endpoint, or of all endpoints."""
+    with _controllers_lock:
+        controllers = dict(_controllers)
+    if endpoint is not None:
+        return controllers[endpoint].snapshot() if endpoint in controllers else {}
+    return {key: value.snapshot() for key, value in controllers.items()}
+
+
+def max_workers() -> int:
+    """Upper bound of in-flight requests, used to size worker pools."""
+    return limiter_config.get("maximum", MAX_CONCURRENCY)
+
+
+@contextlib.contextmanager
+def cancel_scope(event: threading.Event):
+    """Make the requests sent by the current thread cancellable with `event`.
+
+    Once the event is set, requests that have not been sent yet raise
+    `Cancelled` instead; requests already in flight complete normally.
+    """
+    previous = getattr(_scope, "event", None)
+    _scope.event = event
+    try:
+        yield event
+    finally:
+        _scope.event = previous
+
+
+def cancel_event() -> Optional[threading.Event]:
+    """Return the cancellation event of the current thread, see `cancel_scope`."""
+    return getattr(_scope, "event", None)
+
+
+def sleep(seconds: float, cancelled: Optional[threading.Event] = None):
+    """Sleep for `seconds`, raising `Cancelled` as soon as `cancelled` is set."""
+    deadline = time.monotonic() + seconds
+    while True:
+        if cancelled is not None and cancelled.is_set():
+            raise Cancelled()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(remaining if cancelled is None else min(remaining, 0.1))
@@ -1,16 +1,75 @@
 # -*- coding:utf-8 -*-
 import json
+import random
+import time
 
 import requests
 from requests.exceptions import HTTPError
 
+from qweather.utils import concurrency, tracing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 headers = {"Accept-Encoding": "gzip"}
 
+# Field projection per endpoint URL, see `decode`. A `fields` argument of
+# `get` takes precedence.
+projections = {}
+
+# Throttled (429) and failed (500) requests are retried `retries` times,
+# after `retry_backoff * 2 ** attempt` seconds with jitter.
+retries = 3
+retry_backoff = 0.5
+
+# Seconds to wait for the connection and for each read. A request timing out
+# or failing to connect counts as a failed (500) request.
+timeout = 10
+
+
+def decode(content, fields=None):
+    """Decode a JSON response body and keep only the projected fields.
+
+    The body is decoded from raw bytes, with `orjson` when it is installed
+    and the standard library otherwise.
+
+    Args:
+        content (bytes): The raw response body.
+        fields (Optional[dict]): Maps top-level keys to keep to None (keep the
+            whole value) or to the list of keys to keep in the value, applied
+            to each item when the value is a list. "code" is always kept.
+            Example: `{"fxLink": None, "daily": ["fxDate", "textDay"]}`.
+    """
+    data = orjson.loads(content) if orjson is not None else json.loads(content)
+    if fields is None:
+        return data
+    projected = {"code": data["code"]}
+    for key, subfields in fields.items():
+        if key not in data:
+            continue
+        value = data[key]
+        if subfields is not None:
+            if isinstance(value, list):
+                value = [{field: item[field] for field in subfields if field in item} for item in value]
+            elif isinstance(value, dict):
+                value = {field: value[field] for field in subfields if field in value}
+        projected[key] = value
+    return projected
+
+
+def get(api_url, fields=None, **params):
+    endpoint = concurrency.controller(api_url)
+    cancelled = concurrency.cancel_event()
+    for attempt in range(retries + 1):
+        resp, resp_dict = _send(endpoint, api_url, fields, cancelled, params)
+        status_code = int(resp_dict["code"])
+        if status_code not in (429, 500) or attempt == retries:
+            break
+        # The limiter has already been cut, wait a little more before retrying.
+        concurrency.sleep(retry_backoff * 2 ** attempt * random.uniform(0.5, 1.5), cancelled)
 
-def get(api_url, **params):
-    resp = requests.get(_build_url(api_url, **params), headers=headers)
-    resp_dict = json.loads(resp.text)
-    status_code = int(resp_dict["code"])
     if requests.codes.ok != status_code:
         http_error_msg = ""
         if status_code == 204:
@@ -33,6 +92,39 @@ def get(api_url, **params):
     return resp_dict
 
 
+def _send(endpoint, api_url, fields, cancelled, params):
+    with tracing.span("http.wait", endpoint=api_url):
+        window = endpoint.limiter.acquire(cancelled)
+    # Asked only once the request is sure to be sent: a half-open breaker
+    # lets a single probe through and waits for its outcome.
+    if not endpoint.breaker.allow():
+        endpoint.limiter.abandon()
+        raise HTTPError(f"503 Circuit Open: {api_url} 连续请求失败，已暂停访问该接口，请稍后再试。")
+    start = time.monotonic()
+    status = "error"
+    try:
+        with tracing.span("http.request", endpoint=api_url):
+            try:
+                resp = requests.get(_build_url(api_url, **params), headers=headers, timeout=timeout)
+            except (requests.Timeout, requests.ConnectionError):
+                return None, {"code": "500"}
+        with tracing.span("http.decode", endpoint=api_url):
+            resp_dict = decode(resp.content, fields if fields is not None else projections.get(api_url))
+        status_code = int(resp_dict["code"])
+        if status_code == 429:
+            status = "throttled"
+        elif status_code != 500:
+            status = "ok"
+    finally:
+        endpoint.limiter.release(time.monotonic() - start, status, window)
+        # A throttled endpoint is up, only errors count towards opening the breaker.
+        if status == "error":
+            endpoint.breaker.record_failure()
+        else:
+            endpoint.breaker.record_success()
+    return resp, resp_dict
+
+
 def _build_url(api_url, **params):
     query_params = "?"
     for key, value in params.items():
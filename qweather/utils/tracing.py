@@ -0,0 +1,161 @@
+# -*- coding:utf-8 -*-
+r"""Lightweight tracing spans with Chrome trace-event export.
+
+Tracing is disabled by default, and `span` then returns a shared no-op
+context manager, so instrumented code only pays for one global lookup.
+
+Example:
+    .. code-block:: python
+        from qweather.utils import tracing
+
+        tracing.enable()
+        with tracing.span("fetch", city="北京市"):
+            ...
+        tracing.dump("trace.json")  # open in chrome://tracing or Perfetto
+        print(tracing.summary())
+
+Spans recorded inside `tags` carry the tags in their args, so the events
+of concurrent tasks can be told apart and taken separately with `take`.
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from typing import Dict, List
+
+enabled = False
+_events: List[Dict] = []
+_lock = threading.Lock()
+_context = threading.local()
+_NOOP = contextlib.nullcontext()
+
+
+class Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name: str, args: Dict):
+        self.name = name
+        tags = getattr(_context, "tags", None)
+        self.args = {**tags, **args} if tags else args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter_ns()
+        event = {
+            "name": self.name,
+            "cat": self.name.split(".")[0],
+            "ph": "X",
+            "ts": self.start / 1000,
+            "dur": (end - self.start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if self.args:
+            event["args"] = self.args
+        with _lock:
+            _events.append(event)
+        return False
+
+
+def span(name: str, **args):
+    """Return a context manager recording a complete event named `name`."""
+    if not enabled:
+        return _NOOP
+    return Span(name, args)
+
+
+def traced(name: str):
+    """Decorate a function to run it inside a span."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def tags(**values):
+    """Add `values` to the args of every span recorded by the current thread."""
+    previous = current_tags()
+    _context.tags = {**previous, **values}
+    try:
+        yield
+    finally:
+        _context.tags = previous
+
+
+def current_tags() -> Dict:
+    """Return the tags of the current thread, to pass on to the threads it starts."""
+    return getattr(_context, "tags", {})
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset() -> List[Dict]:
+    """Clear the recorded events and return them."""
+    global _events
+    with _lock:
+        events, _events = _events, []
+    return events
+
+
+def take(**values) -> List[Dict]:
+    """Remove and return the recorded events tagged with `values`, see `tags`."""
+    global _events
+    with _lock:
+        taken, kept = [], []
+        for event in _events:
+            args = event.get("args", {})
+            (taken if all(args.get(key) == value for key, value in values.items()) else kept).append(event)
+        _events = kept
+    return taken
+
+
+def events() -> List[Dict]:
+    with _lock:
+        return list(_events)
+
+
+def chrome_trace(recorded: List[Dict] = None) -> Dict:
+    """Return the events in Chrome trace-event (JSON object) format."""
+    return {"traceEvents": events() if recorded is None else recorded, "displayTimeUnit": "ms"}
+
+
+def dump(path: str, recorded: List[Dict] = None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(chrome_trace(recorded), f, ensure_ascii=False)
+
+
+def summary(recorded: List[Dict] = None) -> Dict[str, Dict]:
+    """Aggregate the events per stage name.
+
+    Returns:
+        Dict[str, Dict]: `{name: {"count", "total_ms", "mean_ms", "max_ms"}}`,
+        sorted by total time, descending.
+    """
+    stages: Dict[str, Dict] = {}
+    for event in events() if recorded is None else recorded:
+        stage = stages.setdefault(event["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stage["count"] += 1
+        stage["total_ms"] += event["dur"] / 1000
+        stage["max_ms"] = max(stage["max_ms"], event["dur"] / 1000)
+    for stage in stages.values():
+        stage["mean_ms"] = stage["total_ms"] / stage["count"]
+    return dict(sorted(stages.items(), key=lambda item: item[1]["total_ms"], reverse=True))
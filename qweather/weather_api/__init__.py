@@ -1,32 +1,37 @@
-from .api import CityLookupAPI as city_lookup_api
-from .api import TopCityAPI as top_city_api
-from .api import POILookupAPI as poi_lookup_api
-from .api import POIRangeAPI as poi_range_api
-from .api import NowWeatherAPI as now_weather_api
-from .api import DailyWeatherAPI as daily_weather_api
-from .api import HourWeatherAPI as hour_weather_api
-from .api import MinutelyPrecipitationAPI as minutely_precipitation_api
-from .api import GridNowWeatherAPI as grid_now_weather_api
-from .api import GridDailyWeatherAPI as grid_daily_weather_api
-from .api import GridHourWeatherAPI as grid_hour_weather_api
-from .api import WarningWeatherAPI as warning_weather_api
-from .api import WarningCityListAPI as warning_city_list_api
-from .api import WeatherIndicesAPI as weather_indices_api
-from .api import AQINowAPI as aqi_now_api
-from .api import AQIDailyAPI as aqi_daily_api
-from .api import HistoricalAQIAPI as historical_aqi_api
-from .api import HistoricalWeatherAPI as historical_weather_api
-from .api import TyphoonForecastAPI as typhoon_forecast_api
-from .api import TyphoonTrackAPI as typhoon_track_api
-from .api import TyphoonListAPI as typhoon_list_api
-from .api import OceanTideAPI as ocean_tide_api
-from .api import OceanCurrentsAPI as ocean_currents_api
-from .api import SolarRadiationHourAPI as solar_radiation_hour_api
-from .api import AstronomySunAPI as astronomy_sun_api
-from .api import AstronomyMoonAPI as astronomy_moon_api
-from .api import AstronomySolarElevationAngleAPI as astronomy_solar_elevation_angle_api
+from importlib import import_module
 
-from .params import CityLookupParams, DailyWeatherParams
+# The API classes pull in `requests`, so they are imported on first access.
+_LAZY_ATTRIBUTES = {
+    "city_lookup_api": ("api", "CityLookupAPI"),
+    "top_city_api": ("api", "TopCityAPI"),
+    "poi_lookup_api": ("api", "POILookupAPI"),
+    "poi_range_api": ("api", "POIRangeAPI"),
+    "now_weather_api": ("api", "NowWeatherAPI"),
+    "daily_weather_api": ("api", "DailyWeatherAPI"),
+    "hour_weather_api": ("api", "HourWeatherAPI"),
+    "minutely_precipitation_api": ("api", "MinutelyPrecipitationAPI"),
+    "grid_now_weather_api": ("api", "GridNowWeatherAPI"),
+    "grid_daily_weather_api": ("api", "GridDailyWeatherAPI"),
+    "grid_hour_weather_api": ("api", "GridHourWeatherAPI"),
+    "warning_weather_api": ("api", "WarningWeatherAPI"),
+    "warning_city_list_api": ("api", "WarningCityListAPI"),
+    "weather_indices_api": ("api", "WeatherIndicesAPI"),
+    "aqi_now_api": ("api", "AQINowAPI"),
+    "aqi_daily_api": ("api", "AQIDailyAPI"),
+    "historical_aqi_api": ("api", "HistoricalAQIAPI"),
+    "historical_weather_api": ("api", "HistoricalWeatherAPI"),
+    "typhoon_forecast_api": ("api", "TyphoonForecastAPI"),
+    "typhoon_track_api": ("api", "TyphoonTrackAPI"),
+    "typhoon_list_api": ("api", "TyphoonListAPI"),
+    "ocean_tide_api": ("api", "OceanTideAPI"),
+    "ocean_currents_api": ("api", "OceanCurrentsAPI"),
+    "solar_radiation_hour_api": ("api", "SolarRadiationHourAPI"),
+    "astronomy_sun_api": ("api", "AstronomySunAPI"),
+    "astronomy_moon_api": ("api", "AstronomyMoonAPI"),
+    "astronomy_solar_elevation_angle_api": ("api", "AstronomySolarElevationAngleAPI"),
+    "CityLookupParams": ("params", "CityLookupParams"),
+    "DailyWeatherParams": ("params", "DailyWeatherParams"),
+}
 
 __all__ = [
     "city_lookup_api",
@@ -58,4 +63,17 @@ __all__ = [
     "astronomy_solar_elevation_angle_api",
     "CityLookupParams",
     "DailyWeatherParams",
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module, attribute = _LAZY_ATTRIBUTES[name]
+    value = getattr(import_module(f".{module}", __name__), attribute)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
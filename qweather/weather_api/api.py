@@ -5,6 +5,7 @@ from typing import Any
 import posixpath
 
 import qweather
+from qweather import astronomy
 from qweather.utils.http_client import get
 
 class BaseAPI(ABC):
@@ -190,6 +191,10 @@ class SolarRadiationHourAPI(BaseAPI):
 class AstronomySunAPI(BaseAPI):
     @classmethod
     def invoke(cls, **kwargs):
+        if qweather.local_astronomy:
+            response = astronomy.sun(**kwargs)
+            if response is not None:
+                return response
         kwargs.update(_api_key())
         return get(cls._build_api_url(qweather.weather_api_url, "astronomy", "sun"), **kwargs)
 
@@ -197,6 +202,10 @@ class AstronomySunAPI(BaseAPI):
 class AstronomyMoonAPI(BaseAPI):
     @classmethod
     def invoke(cls, **kwargs):
+        if qweather.local_astronomy:
+            response = astronomy.moon(**kwargs)
+            if response is not None:
+                return response
         kwargs.update(_api_key())
         return get(cls._build_api_url(qweather.weather_api_url, "astronomy", "moon"), **kwargs)
 
@@ -204,6 +213,10 @@ class AstronomyMoonAPI(BaseAPI):
 class AstronomySolarElevationAngleAPI(BaseAPI):
     @classmethod
     def invoke(cls, **kwargs):
+        if qweather.local_astronomy:
+            response = astronomy.solar_elevation_angle(**kwargs)
+            if response is not None:
+                return response
         kwargs.update(_api_key())
         return get(cls._build_api_url(qweather.weather_api_url, "astronomy", "solar-elevation-angle"), **kwargs)
 
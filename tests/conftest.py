@@ -0,0 +1,55 @@
+import json
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # Data files are loaded relative to the working directory.
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.fixture
+def counties(monkeypatch):
+    """Load the county tier from the sample in `tests/data`."""
+    from where_sunshine.utils import GeoIndex, GeoMap
+
+    with open(os.path.join(ROOT, "tests", "data", "counties_cn.json"), encoding="utf-8") as f:
+        sample = json.load(f)
+    GeoMap._load_index()
+    monkeypatch.setattr(GeoMap, "counties", sample)
+    monkeypatch.setattr(GeoMap, "index", GeoIndex.build(GeoMap.data, sample))
+
+
+def forecast(days=7, weather="晴", start=None):
+    """A daily forecast response as returned by `WeatherServer`."""
+    start = start or date.today()
+    daily = [
+        {
+            "date": (start + timedelta(days=i)).isoformat(),
+            "tempMax": "30",
+            "tempMin": "20",
+            "weather": weather,
+            "icon": "100",
+        }
+        for i in range(days)
+    ]
+    return {"code": "200", "daily": daily, "link": "https://www.qweather.com"}
+
+
+def hourly(dates, weather="晴"):
+    """An hourly forecast response covering every hour of `dates`."""
+    return {
+        "hourly": [
+            {"time": f"{day.isoformat()}T{hour:02d}:00+08:00", "temp": "25", "weather": weather}
+            for day in dates
+            for hour in range(24)
+        ],
+        "link": "https://www.qweather.com",
+    }
@@ -0,0 +1,34 @@
+from qweather import astronomy
+
+BEIJING = "116.41,39.92"
+
+
+def test_parse_coordinates():
+    assert astronomy.parse_coordinates(BEIJING) == (116.41, 39.92)
+    assert astronomy.parse_coordinates("beijing") is None
+    assert astronomy.parse_coordinates("101010100") is None
+
+
+def test_sun_matches_published_times():
+    # Beijing on the summer solstice of 2024: sunrise 04:46, sunset 19:46.
+    response = astronomy.sun(BEIJING, "20240621")
+    assert response["code"] == "200"
+    assert response["sunrise"] == "2024-06-21T04:46+08:00"
+    assert response["sunset"] == "2024-06-21T19:46+08:00"
+
+
+def test_daylight_hours():
+    [[summer, winter]] = astronomy.daylight_hours([(116.41, 39.92)], ["20240621", "20241221"])
+    assert 14.9 < summer < 15.1
+    assert 9.2 < winter < 9.4
+
+
+def test_moon_phase():
+    # Full moon on 2024-06-22.
+    phase = astronomy.moon(BEIJING, "20240622")["moonPhase"][0]
+    assert phase["name"] == "满月"
+
+
+def test_solar_elevation_angle_at_noon():
+    response = astronomy.solar_elevation_angle(BEIJING, "20240621", time="1200", tz="0800", alt="43")
+    assert 72 < float(response["solarElevationAngle"]) < 74.5
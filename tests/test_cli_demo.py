@@ -0,0 +1,72 @@
+import io
+import json
+import time
+
+import pytest
+
+import cli_demo
+from where_sunshine.sunshine_finder import SunshineFinder
+
+from conftest import forecast
+
+
+@pytest.fixture
+def finder(monkeypatch):
+    calls = []
+
+    def server(location, adm=None, date=None):
+        calls.append(location)
+        return forecast()
+
+    monkeypatch.setattr(SunshineFinder, "result", {})
+    monkeypatch.setattr(SunshineFinder, "fetch_dates", {})
+    monkeypatch.setattr(SunshineFinder, "progress", False)
+    monkeypatch.setattr(SunshineFinder, "weather_server", server)
+    SunshineFinder.views.clear()
+    return calls
+
+
+def test_parse_query():
+    assert cli_demo.parse_query("华东 北京，晴，5天") == ("华东 北京", "晴", 5)
+    assert cli_demo.parse_query("，，") == ("中国", "晴", 3)
+    assert cli_demo.parse_query(",多云,20240626-20240630") == ("中国", "多云", "20240626-20240630")
+    assert cli_demo.parse_query("北京，晴") is None
+
+
+@pytest.mark.parametrize("query", ["上海，晴，2024", "火星，晴，3天", "上海，晴，x天", "上海，晴，0天", "上海，晴，60天"])
+def test_validate_query_rejects(query):
+    with pytest.raises(ValueError):
+        cli_demo.validate_query(cli_demo.parse_query(query))
+
+
+def test_batch_skips_invalid_queries(finder, capsys):
+    output = io.StringIO()
+    cli_demo.batch(["上海，晴，2024", "上海，晴，3天", "北京"], output=output)
+    rows = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(rows) == 3
+    assert {row["query"] for row in rows} == {"上海，晴，3天"}
+    assert finder == ["上海市"]
+    assert "上海，晴，2024" in capsys.readouterr().err
+
+
+def test_session_streams_and_profiles_each_query(finder, tmp_path, capsys, monkeypatch):
+    from qweather.utils import tracing
+
+    monkeypatch.setattr(tracing, "enabled", True)
+    tracing.reset()
+    session = cli_demo.Session(profile=str(tmp_path))
+    first = session.submit("北京，晴，3天", cli_demo.parse_query("北京，晴，3天"))
+    second = session.submit("上海，晴，3天", cli_demo.parse_query("上海，晴，3天"))
+    deadline = time.monotonic() + 10
+    while session.running() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    session.close()
+
+    out = capsys.readouterr().out
+    assert f"[#{first}] 北京市: " in out
+    assert f"[#{second}] 上海市: " in out
+    traces = [json.loads(path.read_text(encoding="utf-8"))["traceEvents"] for path in tmp_path.iterdir()]
+    assert len(traces) == 2
+    # Every trace holds the events of one query only.
+    assert all({event["args"]["task"] for event in events} == {events[0]["args"]["task"]} for events in traces)
+    assert {events[0]["args"]["task"] for events in traces} == {first, second}
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from qweather.utils import concurrency
+from qweather.utils.concurrency import AdaptiveLimiter, CircuitBreaker
+
+
+def test_limiter_grows_on_healthy_responses():
+    limiter = AdaptiveLimiter(initial=2, maximum=4)
+    for _ in range(20):
+        limiter.release(0.1, "ok", limiter.acquire())
+    assert limiter.snapshot()["limit"] == 4
+
+
+def test_limiter_cuts_once_per_congestion_window():
+    limiter = AdaptiveLimiter(initial=16)
+    windows = [limiter.acquire() for _ in range(8)]
+    for window in windows:
+        limiter.release(0.1, "throttled", window)
+    assert limiter.snapshot()["limit"] == 8
+    assert limiter.snapshot()["throttled"] == 8
+
+    # A request sent after the cut can cut again.
+    limiter.release(0.1, "throttled", limiter.acquire())
+    assert limiter.snapshot()["limit"] == 4
+
+
+def test_limiter_slow_responses_do_not_collapse_the_limit():
+    limiter = AdaptiveLimiter(initial=16)
+    limiter.release(0.1, "ok", limiter.acquire())
+    windows = [limiter.acquire() for _ in range(8)]
+    for window in windows:
+        limiter.release(1.0, "ok", window)
+    assert limiter.snapshot()["limit"] == 8
+
+
+def test_limiter_acquire_raises_when_cancelled():
+    limiter = AdaptiveLimiter(initial=1)
+    limiter.acquire()
+    cancelled = threading.Event()
+    threading.Timer(0.05, cancelled.set).start()
+    with pytest.raises(concurrency.Cancelled):
+        limiter.acquire(cancelled)
+    assert limiter.snapshot()["in_flight"] == 1
+
+
+def test_breaker_opens_and_probes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=3600)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    breaker.opened_at -= 3600
+    assert breaker.allow()
+    assert breaker.snapshot()["state"] == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.snapshot()["state"] == CircuitBreaker.CLOSED
+
+
+def test_cancel_event_follows_its_parent():
+    parent = threading.Event()
+    event = concurrency.CancelEvent(parent)
+    assert not event.is_set()
+    parent.set()
+    assert event.is_set()
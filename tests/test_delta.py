@@ -0,0 +1,55 @@
+from where_sunshine.delta import DeltaFeed, diff_forecast, diff_snapshots
+
+from conftest import forecast
+
+
+def test_diff_forecast():
+    previous = forecast(3, "小雨")
+    current = forecast(3, "小雨")
+    current["daily"][1]["weather"] = "晴"
+    changes = diff_forecast("北京市", previous, current)
+    assert [(change["type"], change["date"]) for change in changes] == [("sunny", current["daily"][1]["date"])]
+
+    later = forecast(3, "小雨")
+    assert diff_forecast("北京市", current, later)[0]["type"] == "not_sunny"
+
+
+def test_diff_forecast_temperature_and_first_forecast():
+    previous = forecast(2)
+    current = forecast(2)
+    current["daily"][0]["tempMax"] = "33"
+    changes = diff_forecast("北京市", previous, current)
+    assert [change["type"] for change in changes] == ["temperature"]
+    assert changes[0]["previous"] == {"tempMin": "20", "tempMax": "30"}
+    assert len(diff_forecast("北京市", None, forecast(2))) == 2
+
+
+def test_diff_snapshots():
+    assert diff_snapshots({"北京市": forecast(2)}, {"北京市": forecast(2), "上海市": forecast(1)}) == \
+        diff_forecast("上海市", None, forecast(1))
+
+
+def test_commit_publishes_once_per_sweep():
+    feed = DeltaFeed()
+    subscription = feed.subscribe()
+    feed.record("北京市", None, forecast(1))
+    assert feed.commit()["sweep"] == 1
+    assert feed.commit() is None
+    assert subscription.get(timeout=1)["changes"][0]["city"] == "北京市"
+    feed.unsubscribe(subscription)
+    assert list(subscription) == []
+
+
+def test_failing_callback_does_not_fail_the_sweep(caplog):
+    feed = DeltaFeed()
+    received = []
+
+    def fail(delta):
+        raise RuntimeError("subscriber bug")
+
+    feed.subscribe(fail)
+    feed.subscribe(received.append)
+    feed.record("北京市", None, forecast(1))
+    assert feed.commit() is not None
+    assert len(received) == 1
+    assert "Delta subscriber failed" in caplog.text
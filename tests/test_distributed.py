@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from where_sunshine.distributed import Coordinator, SQLiteQueue, Worker
+from where_sunshine.sunshine_finder import SunshineFinder
+
+from conftest import forecast
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteQueue(str(tmp_path / "sweep.db"), max_attempts=2)
+
+
+def test_lease_complete_and_results(queue):
+    queue.put("s", ["北京市", "上海市"], 3)
+    items = queue.lease("w1", ttl=60, limit=1)
+    assert items == [("s", "北京市", 3)]
+    assert queue.lease("w2", ttl=60, limit=5) == [("s", "上海市", 3)]
+    assert queue.lease("w3", ttl=60) == []
+    queue.complete("s", "北京市", {"daily": []})
+    assert queue.status("s") == {"pending": 0, "leased": 1, "done": 1, "failed": 0}
+    assert queue.results("s") == {"北京市": {"daily": []}}
+
+
+def test_expired_lease_is_retried_then_failed(queue):
+    queue.put("s", ["北京市"], 3)
+    assert queue.lease("w1", ttl=-1)
+    assert queue.lease("w2", ttl=-1)
+    assert queue.lease("w3", ttl=60) == []
+    assert queue.status("s")["failed"] == 1
+    assert queue.errors("s") == {"北京市": "lease expired"}
+
+
+def test_renewed_lease_is_not_taken(queue):
+    queue.put("s", ["北京市"], 3)
+    queue.lease("w1", ttl=-1)
+    queue.renew("w1", [("s", "北京市")], 60)
+    assert queue.lease("w2", ttl=60) == []
+    # Only the holder of a lease can renew it.
+    queue.renew("w2", [("s", "北京市")], -1)
+    assert queue.lease("w2", ttl=60) == []
+
+
+def test_fail_returns_the_item_until_max_attempts(queue):
+    queue.put("s", ["北京市"], 3)
+    queue.lease("w1", ttl=60)
+    queue.fail("s", "北京市", "w1", "HTTPError: 500")
+    assert queue.status("s")["pending"] == 1
+    queue.lease("w1", ttl=60)
+    queue.fail("s", "北京市", "w1", "HTTPError: 500")
+    assert queue.status("s")["failed"] == 1
+
+
+def test_worker_renews_slow_leases(queue, monkeypatch):
+    fetched = []
+
+    def slow(location, date=None):
+        fetched.append(location)
+        time.sleep(0.6)
+        return forecast()
+
+    monkeypatch.setattr(SunshineFinder, "forecast", slow)
+    monkeypatch.setattr(SunshineFinder, "result", {})
+    monkeypatch.setattr(SunshineFinder, "fetch_dates", {})
+    queue.put("s", ["北京市", "上海市"], 3)
+
+    def run():
+        # SQLite connections belong to the thread that opened them.
+        Worker(SQLiteQueue(queue.path), "w1", lease_ttl=0.3, batch=2).run(idle_timeout=0.1, poll=0.05)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.45)
+    assert queue.lease("w2", ttl=60) == []
+    thread.join()
+    assert sorted(fetched) == ["上海市", "北京市"]
+
+    coordinator = Coordinator(queue, SunshineFinder)
+    assert set(coordinator.merge("s")) == {"北京市", "上海市"}
+    assert set(SunshineFinder.result) == {"北京市", "上海市"}
@@ -0,0 +1,60 @@
+import csv
+import glob
+import os
+from datetime import date
+
+import pytest
+
+from where_sunshine.export import export_snapshot
+
+from conftest import forecast
+
+
+class Finder:
+    def __init__(self, result, fetch_dates, location_ids):
+        self.result = result
+        self.fetch_dates = fetch_dates
+        self.weather_server = type("Server", (), {"location_ids": location_ids})()
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_export_writes_partitions(tmp_path, counties):
+    finder = Finder(
+        {"北京市": forecast(3), "长春市/朝阳区": forecast(3)},
+        {"北京市": date(2024, 6, 26), "长春市/朝阳区": date(2024, 6, 26)},
+        {("北京市", None): ("101010100", "北京"), ("长春市/朝阳区", None): ("101060110", "朝阳")},
+    )
+    [path] = export_snapshot(finder, str(tmp_path), "csv")
+    assert os.path.dirname(path) == os.path.join(str(tmp_path), "fetch_date=2024-06-26")
+    rows = read(path)
+    assert len(rows) == 6
+    county = [row for row in rows if row["city"] == "长春市/朝阳区"][0]
+    assert county["location_id"] == "101060110"
+    assert county["province"] == "吉林省"
+
+
+def test_export_never_truncates_previous_parts(tmp_path):
+    finder = Finder(
+        {"北京市": forecast(3), "上海市": forecast(3)},
+        {"北京市": date(2024, 6, 26), "上海市": date(2024, 6, 26)},
+        {},
+    )
+    export_snapshot(finder, str(tmp_path), "csv")
+    finder.fetch_dates["上海市"] = date(2024, 6, 27)
+    export_snapshot(finder, str(tmp_path), "csv")
+    parts = sorted(glob.glob(os.path.join(str(tmp_path), "fetch_date=2024-06-26", "*.csv")))
+    assert len(parts) == 2
+    assert {row["city"] for row in read(parts[0])} == {"北京市", "上海市"}
+    assert {row["city"] for row in read(parts[1])} == {"北京市"}
+
+
+def test_export_requires_pyarrow_for_parquet(tmp_path):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        with pytest.raises(ImportError):
+            export_snapshot(Finder({}, {}, {}), str(tmp_path), "parquet")
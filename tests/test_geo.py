@@ -0,0 +1,64 @@
+import pytest
+
+from where_sunshine.sunshine_finder import location_to_cities
+from where_sunshine.utils import GeoIndex, GeoMap
+
+
+def test_city_lookups():
+    assert GeoMap.province_to_cities("河北")[:2] == ["石家庄市", "唐山市"]
+    assert GeoMap.city_to_province("石家庄") == "河北省"
+    assert GeoMap.city_to_region("石家庄市") == "华北地区"
+    assert GeoMap.province_to_region("吉林省") == "东北地区"
+    assert len(GeoMap.all_cities()) == len(set(GeoMap.all_cities()))
+
+
+def test_location_to_cities():
+    assert location_to_cities("石家庄") == ["石家庄市"]
+    assert "北京市" in location_to_cities("华北")
+    assert location_to_cities("中国") == GeoMap.all_cities()
+    with pytest.raises(ValueError):
+        location_to_cities("火星")
+
+
+def test_county_tier_requires_data():
+    if GeoMap.all_counties():
+        pytest.skip("county data installed")
+    with pytest.raises(ValueError):
+        location_to_cities("河北", "county")
+
+
+def test_descendants_are_contiguous(counties):
+    index = GeoMap.index
+    province = index.find_exact("河北省", GeoIndex.PROVINCE)
+    counties_of_province = index.descendants(province, GeoIndex.COUNTY)
+    assert [index.label(node) for node in counties_of_province] == [
+        "石家庄市/长安区", "石家庄市/正定县", "唐山市/路南区", "唐山市/迁安市",
+    ]
+
+
+def test_duplicate_county_names_are_labelled(counties):
+    counties = location_to_cities("中国", "county")
+    assert len(counties) == len(set(counties))
+    assert {"北京市/朝阳区", "长春市/朝阳区"} <= set(counties)
+    assert GeoMap.county_to_city("长春市/朝阳区") == "长春市"
+    assert GeoMap.city_to_province("长春市/朝阳区") == "吉林省"
+    assert GeoMap.city_to_province("北京市/朝阳区") == "北京市"
+    assert location_to_cities("朝阳", "county") == ["朝阳市/双塔区", "朝阳市/朝阳县"]
+    assert location_to_cities("长春市/朝阳区", "county") == ["长春市/朝阳区"]
+
+
+def test_county_forecasts_are_looked_up_within_their_city(counties, monkeypatch):
+    from where_sunshine.weather_server import WeatherServer
+
+    lookups = []
+
+    class Client:
+        def invoke(self, **params):
+            lookups.append((params["location"], params["adm"]))
+            return {"location": [{"id": str(len(lookups)), "name": params["location"], "lon": "0", "lat": "0"}]}
+
+    server = WeatherServer.__new__(WeatherServer)
+    server.location_ids, server.location_coordinates = {}, {}
+    server.city_lookup_client, server.scope, server.lang = Client(), "cn", "zh"
+    assert server.location_id("长春市/朝阳区") != server.location_id("北京市/朝阳区")
+    assert lookups == [("朝阳区", "长春市"), ("朝阳区", "北京市")]
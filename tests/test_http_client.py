@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+
+import pytest
+from requests.exceptions import HTTPError
+
+from qweather.utils import concurrency, http_client
+
+
+class FakeResponse:
+    def __init__(self, code):
+        self.content = json.dumps({"code": str(code), "daily": []}).encode()
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    codes = []
+    def get(url, headers, timeout):
+        code = codes.pop(0)
+        if isinstance(code, Exception):
+            raise code
+        return FakeResponse(code)
+
+    monkeypatch.setattr(http_client.requests, "get", get)
+    monkeypatch.setattr(http_client, "retry_backoff", 0)
+    monkeypatch.setattr(concurrency, "_controllers", {})
+    return codes
+
+
+def test_get_retries_throttled_requests(responses):
+    responses.extend([429, 500, 200])
+    assert http_client.get("https://example.com/v7/weather")["code"] == "200"
+    assert not responses
+    assert concurrency.stats("https://example.com/v7/weather")["breaker"]["state"] == "closed"
+
+
+def test_get_retries_timeouts_and_connection_errors(responses):
+    responses.extend([http_client.requests.Timeout(), http_client.requests.ConnectionError(), 200])
+    assert http_client.get("https://example.com/v7/weather")["code"] == "200"
+    assert not responses
+
+
+def test_get_counts_timeouts_as_failures(responses):
+    responses.extend([http_client.requests.Timeout()] * (http_client.retries + 1))
+    with pytest.raises(HTTPError, match="500"):
+        http_client.get("https://example.com/v7/weather")
+    breaker = concurrency.stats("https://example.com/v7/weather")["breaker"]
+    assert breaker["failures"] == http_client.retries + 1
+
+
+def test_get_gives_up_after_retries(responses):
+    responses.extend([429] * (http_client.retries + 1))
+    with pytest.raises(HTTPError, match="429"):
+        http_client.get("https://example.com/v7/weather")
+
+
+def test_get_does_not_retry_client_errors(responses):
+    responses.extend([404, 200])
+    with pytest.raises(HTTPError, match="404"):
+        http_client.get("https://example.com/v7/weather")
+    assert responses == [200]
+
+
+def test_cancelled_request_does_not_take_the_breaker_probe(responses):
+    url = "https://example.com/v7/weather"
+    endpoint = concurrency.controller(url)
+    endpoint.breaker.state = endpoint.breaker.OPEN
+    endpoint.breaker.opened_at = time.monotonic() - 3600
+    cancelled = threading.Event()
+    cancelled.set()
+    with concurrency.cancel_scope(cancelled):
+        with pytest.raises(concurrency.Cancelled):
+            http_client.get(url)
+    assert endpoint.breaker.snapshot()["state"] == "open"
+
+    responses.append(200)
+    assert http_client.get(url)["code"] == "200"
+    assert endpoint.breaker.snapshot()["state"] == "closed"
+
+
+def test_open_breaker_releases_the_slot(responses):
+    url = "https://example.com/v7/weather"
+    endpoint = concurrency.controller(url)
+    endpoint.breaker.state = endpoint.breaker.OPEN
+    endpoint.breaker.opened_at = float("inf")
+    with pytest.raises(HTTPError, match="503"):
+        http_client.get(url)
+    assert endpoint.limiter.snapshot()["in_flight"] == 0
+
+
+def test_decode_projects_fields():
+    content = json.dumps({
+        "code": "200",
+        "fxLink": "https://www.qweather.com",
+        "updateTime": "2024-06-26T10:00+08:00",
+        "daily": [{"fxDate": "2024-06-26", "textDay": "晴", "wind360Day": "90"}],
+        "refer": {"sources": ["QWeather"]},
+    }).encode()
+    assert http_client.decode(content, {"fxLink": None, "daily": ["fxDate", "textDay"], "now": None}) == {
+        "code": "200",
+        "fxLink": "https://www.qweather.com",
+        "daily": [{"fxDate": "2024-06-26", "textDay": "晴"}],
+    }
+    assert http_client.decode(content)["refer"] == {"sources": ["QWeather"]}
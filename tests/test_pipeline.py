@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from where_sunshine.pipeline import Pipeline, Stage
+
+
+def test_only_passing_items_go_downstream():
+    calls = []
+    lock = threading.Lock()
+
+    def record(name, value):
+        with lock:
+            calls.append((name, value))
+        return value
+
+    pipeline = Pipeline([
+        Stage("daily", lambda item: record("daily", item), predicate=lambda value: value % 2 == 0),
+        Stage("aqi", lambda item: record("aqi", item * 10), upstream="daily"),
+        Stage("sun", lambda item: record("sun", -item), upstream="daily"),
+    ])
+    result = pipeline.run(range(5))
+    assert result == {item: {"daily": item, "aqi": item * 10, "sun": -item} for item in (0, 2, 4)}
+    assert sorted(value for name, value in calls if name == "aqi") == [0, 20, 40]
+
+
+def test_stage_cache_key():
+    calls = []
+    stage = Stage("aqi", lambda item: calls.append(item) or len(calls), key=lambda item: item[0])
+    assert stage("ab") == stage("ac") == 1
+    assert calls == ["ab"]
+
+
+def test_first_error_is_raised():
+    def fail(item):
+        raise ValueError(item)
+
+    with pytest.raises(ValueError):
+        Pipeline([Stage("daily", lambda item: item), Stage("aqi", fail, upstream="daily")]).run([1, 2])
+
+
+def test_first_error_stops_queued_items():
+    calls = []
+
+    def fetch(item):
+        calls.append(item)
+        if item == 0:
+            raise ValueError(item)
+        return item
+
+    with pytest.raises(ValueError):
+        Pipeline([Stage("daily", fetch, concurrency=1)]).run(range(100))
+    assert calls == [0]
+
+
+def test_stage_sends_one_request_per_key_in_flight():
+    calls = []
+
+    def fetch(item):
+        calls.append(item)
+        time.sleep(0.05)
+        return item[0]
+
+    stage = Stage("aqi", fetch, concurrency=4, key=lambda item: item[0])
+    result = Pipeline([stage]).run(["ab", "ac", "ad", "ae"])
+    assert {value["aqi"] for value in result.values()} == {"a"}
+    assert len(calls) == 1
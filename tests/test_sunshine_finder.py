@@ -0,0 +1,240 @@
+import threading
+import time
+
+import pytest
+
+from qweather.utils import concurrency
+from where_sunshine.sunshine_finder import SunshineFinder, fetch_concurrently
+
+from conftest import forecast, hourly
+from where_sunshine.utils import format_date
+
+
+@pytest.fixture
+def finder(monkeypatch):
+    monkeypatch.setattr(SunshineFinder, "result", {})
+    monkeypatch.setattr(SunshineFinder, "fetch_dates", {})
+    monkeypatch.setattr(SunshineFinder, "hourly_result", {})
+    monkeypatch.setattr(SunshineFinder, "progress", False)
+    return SunshineFinder
+
+
+def test_fetch_concurrently_stops_on_error_and_keeps_completed():
+    sent = []
+    lock = threading.Lock()
+
+    def fetch(city, date):
+        with lock:
+            sent.append(city)
+        if city == "c0":
+            raise RuntimeError("fatal")
+        time.sleep(0.01)
+        return city
+
+    cities = [f"c{i}" for i in range(500)]
+    yielded = []
+    with pytest.raises(RuntimeError):
+        for city, response in fetch_concurrently(fetch, cities, 3, progress=False):
+            yielded.append(city)
+    assert len(sent) < len(cities)
+    assert set(yielded) == set(sent) - {"c0"}
+
+
+def test_fetch_concurrently_cancelled():
+    cancelled = threading.Event()
+    cancelled.set()
+    with concurrency.cancel_scope(cancelled):
+        with pytest.raises(concurrency.Cancelled):
+            list(fetch_concurrently(lambda city, date: city, ["a", "b"], 3, progress=False))
+
+
+def test_fetch_weather_keeps_forecasts_fetched_before_an_error(finder, monkeypatch):
+    def server(location, adm=None, date=None):
+        if location == "北京市":
+            raise RuntimeError("fatal")
+        return forecast()
+
+    monkeypatch.setattr(SunshineFinder, "weather_server", server)
+    with pytest.raises(RuntimeError):
+        finder.fetch_weather(finder, "华北", 3)
+    assert finder.result
+    assert "北京市" not in finder.result
+
+
+class HourlyServer:
+    def __init__(self):
+        self.calls = []
+
+    def hourly(self, location, adm=None, date=1):
+        self.calls.append((location, date))
+        return hourly(format_date(date))
+
+
+def test_fetch_hourly_filters_cached_hours_to_the_query(finder, monkeypatch):
+    server = HourlyServer()
+    monkeypatch.setattr(SunshineFinder, "weather_server", server)
+    assert len(finder.fetch_hourly(finder, ["北京市"], 3)["北京市"]["hourly"]) == 72
+    assert len(finder.fetch_hourly(finder, ["北京市"], 1)["北京市"]["hourly"]) == 24
+    assert len(server.calls) == 1
+
+
+def test_fetch_hourly_answers_today_after_tomorrow(finder, monkeypatch):
+    server = HourlyServer()
+    monkeypatch.setattr(SunshineFinder, "weather_server", server)
+    today, tomorrow = format_date(2)
+    first = finder.fetch_hourly(finder, ["北京市"], f"{tomorrow:%Y%m%d}")["北京市"]["hourly"]
+    assert {hour["time"][:10] for hour in first} == {tomorrow.isoformat()}
+    second = finder.fetch_hourly(finder, ["北京市"], 1)["北京市"]["hourly"]
+    assert {hour["time"][:10] for hour in second} == {today.isoformat()}
+
+
+class WarningServer:
+    ids = {"北京市": "101010100", "石家庄市": "101090101", "唐山市": "101090501", "上海市": "101020100"}
+
+    def __init__(self, warnings):
+        self.warnings = warnings
+        self.location_ids = {}
+        self.lookups = []
+        self.saves = 0
+
+    def warning_location_ids(self):
+        return set(self.warnings)
+
+    def location_id(self, location, adm=None):
+        self.lookups.append(location)
+        self.location_ids[(location, adm)] = (self.ids[location], location)
+        return self.ids[location]
+
+    def save_locations(self):
+        self.saves += 1
+
+
+def test_prefecture_code():
+    from where_sunshine.sunshine_finder import prefecture_code
+
+    assert prefecture_code("101010200") == prefecture_code("101010100")
+    assert prefecture_code("101020600") == prefecture_code("101020100")
+    assert prefecture_code("101090102") == prefecture_code("101090101")
+    assert prefecture_code("101090501") != prefecture_code("101090101")
+
+
+def test_filter_warned_joins_counties_and_districts(finder, monkeypatch):
+    # A Haidian (北京) district warning and a county warning of 石家庄.
+    server = WarningServer(["101010200", "101090102"])
+    monkeypatch.setattr(SunshineFinder, "weather_server", server)
+    monkeypatch.setattr(SunshineFinder, "warning_time", None)
+    cities = ["北京市", "石家庄市", "唐山市", "上海市"]
+    assert finder.filter_warned(cities) == ["北京市", "石家庄市"]
+    assert sorted(server.lookups) == sorted(cities)
+
+    assert finder.filter_warned(cities) == ["北京市", "石家庄市"]
+    assert len(server.lookups) == len(cities)
+    assert server.saves == 1
+
+
+def test_overview_refines_only_provinces_with_mixed_samples(finder, monkeypatch):
+    # 石家庄市 is sunny and the other cities of 河北省 are rainy.
+    def server(location, adm=None, date=None):
+        return forecast(weather="晴" if location in ("石家庄市", "北京市") else "雨")
+
+    monkeypatch.setattr(SunshineFinder, "weather_server", server)
+    monkeypatch.setattr(SunshineFinder, "refiner", None)
+    refined = []
+    monkeypatch.setattr(SunshineFinder, "refine", classmethod(lambda cls, provinces, date=None: refined.extend(provinces)))
+
+    overview = finder.overview(3)
+    assert all(estimate["ratio"] in (0, 1) for estimate in overview.values())
+    assert refined == []
+
+    overview = finder.overview(3, samples=3)
+    assert 0 < overview["河北省"]["ratio"] < 1
+    assert "河北省" in refined
+    assert all(0 < overview[province]["ratio"] < 1 for province in refined)
+
+
+def test_refine_keeps_forecasts_and_logs_failures(finder, monkeypatch, caplog):
+    def server(location, adm=None, date=None):
+        if location == "唐山市":
+            raise RuntimeError("fatal")
+        return forecast()
+
+    monkeypatch.setattr(SunshineFinder, "weather_server", server)
+    monkeypatch.setattr(SunshineFinder, "refiner", None)
+    future = finder.refine(["河北省"], 3)
+    with pytest.raises(RuntimeError):
+        future.result()
+    finder.refiner.shutdown(wait=True)
+    assert "Background refinement failed" in caplog.text
+    assert "唐山市" not in finder.result
+
+
+class EnrichServer:
+    lang = "zh"
+
+    def __init__(self):
+        self.calls = []
+        server = self
+
+        class Client:
+            def __init__(self, name):
+                self.name = name
+
+            def invoke(self, **params):
+                server.calls.append((self.name, params["location"]))
+                return {"daily": [self.name]}
+
+        self.aqi_client, self.indices_client, self.sun_client = Client("aqi"), Client("indices"), Client("sun")
+
+    def __call__(self, location, adm=None, date=None):
+        return forecast()
+
+    def location_id(self, location, adm=None):
+        return location
+
+    def coordinates(self, location, adm=None):
+        return 116.4, 39.9
+
+
+def test_enrich_cache_expires_daily(finder, monkeypatch):
+    from datetime import timedelta
+
+    server = EnrichServer()
+    monkeypatch.setattr(SunshineFinder, "weather_server", server)
+    monkeypatch.setattr(SunshineFinder, "enrich_cache", {})
+    result = finder.enrich("北京", 1)
+    assert result["北京市"]["aqi"] == ["aqi"]
+    assert finder.enrich("北京", 1) == result
+    assert len(server.calls) == 3
+
+    # Responses cached on a previous day are fetched again.
+    for name in ("aqi", "indices"):
+        cache = finder.enrich_cache[name]
+        for (location_id, day), response in list(cache.items()):
+            del cache[(location_id, day)]
+            cache[(location_id, day - timedelta(days=1))] = response
+    finder.enrich("北京", 1)
+    assert [name for name, _ in server.calls].count("aqi") == 2
+    assert len(finder.enrich_cache["aqi"]) == 1
+
+
+class CoordinatesServer(WarningServer):
+    def __init__(self):
+        super().__init__([])
+        self.threads = set()
+
+    def location_id(self, location, adm=None):
+        self.threads.add(threading.current_thread().name)
+        return super().location_id(location, adm)
+
+    def coordinates(self, location, adm=None):
+        assert (location, adm) in self.location_ids
+        return 116.41, 39.92
+
+
+def test_daylight_hours_looks_up_coordinates_concurrently(finder, monkeypatch):
+    server = CoordinatesServer()
+    monkeypatch.setattr(SunshineFinder, "weather_server", server)
+    hours = finder.daylight_hours("北京", "20240621")
+    assert 14.5 < hours["北京市"]["2024-06-21"] < 15.5
+    assert threading.current_thread().name not in server.threads
+    assert server.saves == 1
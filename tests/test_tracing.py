@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+from qweather.utils import tracing
+
+
+@pytest.fixture
+def enabled():
+    tracing.reset()
+    tracing.enable()
+    yield
+    tracing.disable()
+    tracing.reset()
+
+
+def test_disabled_span_is_a_noop():
+    tracing.reset()
+    with tracing.span("noop"):
+        pass
+    assert tracing.events() == []
+
+
+def test_summary(enabled):
+    for _ in range(3):
+        with tracing.span("stage.a"):
+            pass
+    with tracing.span("stage.b", city="北京市"):
+        pass
+    summary = tracing.summary()
+    assert summary["stage.a"]["count"] == 3
+    assert tracing.chrome_trace()["traceEvents"][-1]["args"] == {"city": "北京市"}
+
+
+def test_take_separates_tagged_tasks(enabled):
+    def task(number):
+        with tracing.tags(task=number):
+            with tracing.span("work"):
+                pass
+
+    threads = [threading.Thread(target=task, args=(number,)) for number in (1, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with tracing.span("untagged"):
+        pass
+
+    taken = tracing.take(task=1)
+    assert [event["args"]["task"] for event in taken] == [1]
+    assert sorted(event["name"] for event in tracing.events()) == ["untagged", "work"]
+    assert tracing.current_tags() == {}
@@ -0,0 +1,24 @@
+from where_sunshine.utils import find_windows, match_weather
+
+
+def hours(*weathers):
+    return [{"time": f"2024-06-26T{hour:02d}:00+08:00", "weather": weather} for hour, weather in enumerate(weathers)]
+
+
+def test_match_weather():
+    assert match_weather("晴", "晴")
+    assert match_weather("多云", "多云")
+    assert not match_weather("小雨", "晴")
+
+
+def test_find_windows():
+    windows = find_windows(hours("晴", "晴", "小雨", "晴", "晴", "晴"), "晴", 2)
+    assert windows == [
+        {"start": "2024-06-26T00:00+08:00", "end": "2024-06-26T01:00+08:00", "hours": 2},
+        {"start": "2024-06-26T03:00+08:00", "end": "2024-06-26T05:00+08:00", "hours": 3},
+    ]
+
+
+def test_find_windows_minimum_length():
+    assert find_windows(hours("晴", "小雨", "晴", "晴"), "晴", 3) == []
+    assert find_windows([], "晴") == []
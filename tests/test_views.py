@@ -0,0 +1,49 @@
+from where_sunshine.utils import format_date
+from where_sunshine.views import MaterializedViews
+
+from conftest import forecast
+
+
+def test_views_are_updated_per_city():
+    views = MaterializedViews()
+    dates = format_date(3)
+    view = views.build("华北", "晴", dates, {"北京市": forecast(7), "天津市": forecast(7, "小雨")})
+    assert list(view.result) == ["北京市"]
+    assert len(view.result["北京市"]["daily"]) == 3
+    assert view.structured == {"华北地区": {"北京市": {"北京市": view.result["北京市"]}}}
+
+    views.update("天津市", forecast(7))
+    views.update("北京市", forecast(7, "小雨"))
+    assert list(view.result) == ["天津市"]
+    assert list(view.structured["华北地区"]) == ["天津市"]
+    assert views.get("华北", "晴", dates) is view
+    assert views.get("华北", "晴", dates, "county") is None
+
+
+def test_unrelated_cities_do_not_touch_a_view():
+    views = MaterializedViews()
+    view = views.build("北京", "晴", format_date(3), {"北京市": forecast(7)})
+    views.update("上海市", forecast(7))
+    assert list(view.result) == ["北京市"]
+
+
+def test_past_views_are_dropped():
+    from datetime import timedelta
+
+    views = MaterializedViews()
+    dates = format_date(3)
+    views.build("北京", "晴", dates, {"北京市": forecast(7)})
+    views.build("华北", "晴", dates[1:], {"北京市": forecast(7), "天津市": forecast(7)})
+    views.expire(dates[-1] + timedelta(days=1))
+    assert views.views == {}
+    assert views.index == {}
+
+    views = MaterializedViews()
+    old = views.build("北京", "晴", dates[:1], {"北京市": forecast(7)})
+    current = views.build("华北", "晴", dates, {"北京市": forecast(7), "天津市": forecast(7)})
+    views.expire(dates[1])
+    assert list(views.views.values()) == [current]
+    assert views.index == {"北京市": {("华北", "晴", tuple(dates), "city")}, "天津市": {("华北", "晴", tuple(dates), "city")}}
+    views.update("北京市", forecast(7, "小雨"))
+    assert "北京市" in old.result
+    assert "北京市" not in current.result
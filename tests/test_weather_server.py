@@ -0,0 +1,44 @@
+from where_sunshine.weather_server import WeatherServer
+
+
+class LookupClient:
+    def __init__(self):
+        self.lookups = []
+
+    def invoke(self, **params):
+        self.lookups.append(params["location"])
+        return {"location": [{"id": "101010100", "name": params["location"], "lon": "116.41", "lat": "39.92"}]}
+
+
+def server(locations_file, client):
+    server = WeatherServer.__new__(WeatherServer)
+    server.location_ids, server.location_coordinates = {}, {}
+    server.locations_file, server._unsaved = locations_file, False
+    server.city_lookup_client, server.scope, server.lang = client, "cn", "zh"
+    server.load_locations()
+    return server
+
+
+def test_lookups_are_saved_and_loaded(tmp_path):
+    locations_file = str(tmp_path / "data" / "locations_cn.json")
+    client = LookupClient()
+    first = server(locations_file, client)
+    first.location_id("北京市")
+    first.location_id("朝阳", adm="北京")
+    first.save_locations()
+
+    second = server(locations_file, client)
+    assert second.location_id("北京市") == "101010100"
+    assert second.coordinates("北京市") == (116.41, 39.92)
+    assert client.lookups == ["北京市", "朝阳"]
+    # Only locations without `adm` are saved.
+    assert ("朝阳", "北京") not in second.location_ids
+
+
+def test_save_locations_without_file(tmp_path):
+    client = LookupClient()
+    memory = server(None, client)
+    memory.location_id("北京市")
+    memory.save_locations()
+    assert memory.location_id("北京市") == "101010100"
+    assert client.lookups == ["北京市"]
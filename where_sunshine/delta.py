@@ -0,0 +1,143 @@
+import logging
+import queue
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .utils import match_weather
+
+logger = logging.getLogger(__name__)
+
+
+def diff_forecast(city: str, previous: Optional[dict], current: dict, weather: str = "晴") -> List[dict]:
+    """Return the changes between two daily forecasts of a city.
+
+    Changes are dicts with a "type" of:
+        - "sunny": the date became sunny (or is sunny in the first forecast).
+        - "not_sunny": the date was sunny and no longer is.
+        - "temperature": the date stays sunny but its temperatures changed.
+
+    Dates only in the previous forecast (e.g. days that have passed) are ignored.
+    """
+    before = {day_weather["date"]: day_weather for day_weather in (previous or {}).get("daily", [])}
+    changes = []
+    for day_weather in current["daily"]:
+        old = before.get(day_weather["date"])
+        was_sunny = old is not None and match_weather(old["weather"], weather)
+        is_sunny = match_weather(day_weather["weather"], weather)
+        change = None
+        if is_sunny and not was_sunny:
+            change = {"type": "sunny"}
+        elif was_sunny and not is_sunny:
+            change = {"type": "not_sunny"}
+        elif is_sunny and (old["tempMin"], old["tempMax"]) != (day_weather["tempMin"], day_weather["tempMax"]):
+            change = {"type": "temperature", "previous": {"tempMin": old["tempMin"], "tempMax": old["tempMax"]}}
+        if change is not None:
+            change.update({
+                "city": city,
+                "date": day_weather["date"],
+                "weather": day_weather["weather"],
+                "tempMin": day_weather["tempMin"],
+                "tempMax": day_weather["tempMax"],
+            })
+            changes.append(change)
+    return changes
+
+
+def diff_snapshots(previous: Dict[str, dict], current: Dict[str, dict], weather: str = "晴") -> List[dict]:
+    """Return the changes between two `{city: forecast}` snapshots, see `diff_forecast`."""
+    changes = []
+    for city, forecast in current.items():
+        changes.extend(diff_forecast(city, previous.get(city), forecast, weather))
+    return changes
+
+
+class Subscription:
+    r"""A subscriber of a `DeltaFeed`.
+
+    With a callback, every delta is passed to it on the publishing thread;
+    errors of the callback are logged, never raised to the publisher.
+    Without one, deltas are queued and the subscription is an iterator that
+    blocks until the next delta and stops once it is unsubscribed.
+    """
+
+    def __init__(self, callback: Optional[Callable[[dict], None]] = None, maxsize: int = 0):
+        self.callback = callback
+        self.queue = None if callback is not None else queue.Queue(maxsize)
+
+    def deliver(self, delta: Optional[dict]):
+        if self.callback is not None:
+            if delta is not None:
+                self.callback(delta)
+        else:
+            self.queue.put(delta)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Return the next delta, or None when unsubscribed. Raises `queue.Empty` on timeout."""
+        return self.queue.get(timeout=timeout)
+
+    def __iter__(self) -> Iterator[dict]:
+        while True:
+            delta = self.get()
+            if delta is None:
+                return
+            yield delta
+
+
+class DeltaFeed:
+    r"""Sweep-to-sweep changes of the forecast cache.
+
+    City forecasts are recorded as they are refreshed and every sweep is
+    committed as one delta:
+    `{"sweep": int, "time": str, "changes": [...]}`, see `diff_forecast`.
+    Sweeps without changes are not published.
+
+    Example:
+        .. code-block:: python
+            from where_sunshine import sunshine_finder
+
+            subscription = sunshine_finder.feed.subscribe(print)
+            # or iterate in another thread
+            for delta in sunshine_finder.feed.subscribe():
+                ...
+    """
+
+    def __init__(self, weather: str = "晴"):
+        self.weather = weather
+        self.sweep = 0
+        self.pending: List[dict] = []
+        self.subscriptions: List[Subscription] = []
+        self._lock = threading.Lock()
+
+    def record(self, city: str, previous: Optional[dict], current: dict):
+        changes = diff_forecast(city, previous, current, self.weather)
+        with self._lock:
+            self.pending.extend(changes)
+
+    def commit(self) -> Optional[dict]:
+        """Publish the changes recorded since the last commit as one delta."""
+        with self._lock:
+            if not self.pending:
+                return None
+            self.sweep += 1
+            delta = {"sweep": self.sweep, "time": datetime.now().isoformat(timespec="seconds"), "changes": self.pending}
+            self.pending = []
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.deliver(delta)
+            except Exception:
+                # A subscriber must not fail the sweep that published the delta, nor other subscribers.
+                logger.exception("Delta subscriber failed on sweep %d", delta["sweep"])
+        return delta
+
+    def subscribe(self, callback: Optional[Callable[[dict], None]] = None, maxsize: int = 0) -> Subscription:
+        subscription = Subscription(callback, maxsize)
+        with self._lock:
+            self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self.subscriptions.remove(subscription)
+        subscription.deliver(None)
@@ -0,0 +1,351 @@
+r"""Lease-based sharding of forecast sweeps across processes and nodes.
+
+A coordinator puts one work item per city into a `WorkQueue`, and any
+number of workers lease items, fetch the forecasts and complete them. A
+worker renews the leases of its items while they are fetched, and a lease
+expires `lease_ttl` seconds after its last renewal, so the items of a
+crashed or stalled worker are retried by others, up to `max_attempts`
+times. The coordinator waits for the sweep and merges the results into
+the finder's forecast cache through `SunshineFinder.store`.
+
+The results also stay in the queue, so any process can merge a finished
+sweep with `Coordinator.merge`. The `coordinator` command exits after the
+merge; pass `--export DIR` to keep the merged forecasts as a snapshot,
+see `where_sunshine.export`.
+
+`SQLiteQueue` is a local implementation shared by the worker processes of
+a host. Multi-node backends (e.g. a network queue) only have to implement
+`WorkQueue`.
+
+Usage:
+    .. code-block:: shell
+        # on every node
+        python -m where_sunshine.distributed worker --queue sweep.db
+        # on the coordinator
+        python -m where_sunshine.distributed coordinator --queue sweep.db --location 中国 --date 7 --export snapshots
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+
+class WorkQueue(ABC):
+    @abstractmethod
+    def put(self, sweep: str, cities: List[str], date: Union[int, str]):
+        ...
+
+    @abstractmethod
+    def lease(self, worker: str, ttl: float, limit: int = 1) -> List[Tuple[str, str, Union[int, str]]]:
+        """Claim up to `limit` pending or expired items as `(sweep, city, date)`."""
+        ...
+
+    @abstractmethod
+    def renew(self, worker: str, items: List[Tuple[str, str]], ttl: float):
+        """Extend the leases the worker still holds on `(sweep, city)` items to `ttl` seconds from now."""
+        ...
+
+    @abstractmethod
+    def complete(self, sweep: str, city: str, result: Dict):
+        ...
+
+    @abstractmethod
+    def fail(self, sweep: str, city: str, worker: str, error: str):
+        ...
+
+    @abstractmethod
+    def status(self, sweep: str) -> Dict[str, int]:
+        """Number of items per status ("pending", "leased", "done", "failed")."""
+        ...
+
+    @abstractmethod
+    def results(self, sweep: str) -> Dict[str, Dict]:
+        ...
+
+
+class SQLiteQueue(WorkQueue):
+    r"""Work queue stored in a SQLite database file.
+
+    Args:
+        path (str): Path of the database file.
+        max_attempts (int): Leases of an item before it is marked failed.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS tasks (
+                sweep TEXT NOT NULL,
+                city TEXT NOT NULL,
+                date TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                PRIMARY KEY (sweep, city)
+            )"""
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_until)")
+
+    def put(self, sweep, cities, date):
+        with self._transaction():
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO tasks (sweep, city, date) VALUES (?, ?, ?)",
+                [(sweep, city, json.dumps(date)) for city in cities],
+            )
+
+    def lease(self, worker, ttl, limit=1):
+        now = time.time()
+        with self._transaction():
+            self.connection.execute(
+                "UPDATE tasks SET status = 'failed', error = 'lease expired' "
+                "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            rows = self.connection.execute(
+                "SELECT sweep, city, date FROM tasks "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                "ORDER BY attempts LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            self.connection.executemany(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE sweep = ? AND city = ?",
+                [(worker, now + ttl, sweep, city) for sweep, city, _ in rows],
+            )
+        return [(sweep, city, json.loads(date)) for sweep, city, date in rows]
+
+    def renew(self, worker, items, ttl):
+        with self._transaction():
+            self.connection.executemany(
+                "UPDATE tasks SET lease_until = ? "
+                "WHERE sweep = ? AND city = ? AND worker = ? AND status = 'leased'",
+                [(time.time() + ttl, sweep, city, worker) for sweep, city in items],
+            )
+
+    def complete(self, sweep, city, result):
+        # A late result of an expired lease is still a valid forecast, keep the first one.
+        with self._transaction():
+            self.connection.execute(
+                "UPDATE tasks SET status = 'done', result = ?, error = NULL "
+                "WHERE sweep = ? AND city = ? AND status != 'done'",
+                (json.dumps(result, ensure_ascii=False), sweep, city),
+            )
+
+    def fail(self, sweep, city, worker, error):
+        with self._transaction():
+            self.connection.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "worker = NULL, lease_until = NULL, error = ? "
+                "WHERE sweep = ? AND city = ? AND worker = ? AND status = 'leased'",
+                (self.max_attempts, error, sweep, city, worker),
+            )
+
+    def status(self, sweep):
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        for status, count in self.connection.execute(
+            "SELECT status, COUNT(*) FROM tasks WHERE sweep = ? GROUP BY status", (sweep,)
+        ):
+            counts[status] = count
+        return counts
+
+    def results(self, sweep):
+        return {
+            city: json.loads(result)
+            for city, result in self.connection.execute(
+                "SELECT city, result FROM tasks WHERE sweep = ? AND status = 'done'", (sweep,)
+            )
+        }
+
+    def errors(self, sweep: str) -> Dict[str, str]:
+        return dict(self.connection.execute(
+            "SELECT city, error FROM tasks WHERE sweep = ? AND status = 'failed'", (sweep,)
+        ))
+
+    def _transaction(self):
+        return _Transaction(self.connection)
+
+
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, *exc_info):
+        self.connection.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+        return False
+
+
+class Worker:
+    r"""Lease items from a queue and fetch their forecasts.
+
+    Args:
+        queue (WorkQueue): The shared work queue.
+        name (Optional[str]): Worker name, defaults to `host:pid`.
+        lease_ttl (float): Seconds without renewal before a lease expires and
+            the item can be retried by another worker. Leases of the items
+            being fetched are renewed every `lease_ttl / 3` seconds.
+        batch (int): Items leased at a time, fetched concurrently.
+    """
+
+    def __init__(self, queue: WorkQueue, name: Optional[str] = None, lease_ttl: float = 60, batch: int = 8):
+        self.queue = queue
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_ttl = lease_ttl
+        self.batch = batch
+
+    def run(self, idle_timeout: Optional[float] = 5.0, poll: float = 0.5) -> int:
+        """Process items until the queue stays empty for `idle_timeout` seconds (forever if None).
+
+        Returns:
+            int: Number of completed items.
+        """
+        from .sunshine_finder import SunshineFinder
+
+        forecast = SunshineFinder.forecast
+        completed = 0
+        idle_since = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.batch) as executor:
+            while True:
+                items = self.queue.lease(self.name, self.lease_ttl, self.batch)
+                if not items:
+                    if idle_timeout is not None and time.monotonic() - idle_since > idle_timeout:
+                        return completed
+                    time.sleep(poll)
+                    continue
+                idle_since = time.monotonic()
+                futures = {executor.submit(forecast, city, date): (sweep, city) for sweep, city, date in items}
+                pending = set(futures)
+                renewed = time.monotonic()
+                while pending:
+                    done, pending = wait(pending, timeout=self.lease_ttl / 3, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        sweep, city = futures[future]
+                        try:
+                            response = future.result()
+                        except Exception as e:
+                            self.queue.fail(sweep, city, self.name, f"{type(e).__name__}: {e}")
+                            continue
+                        self.queue.complete(sweep, city, {"daily": response["daily"], "link": response["link"]})
+                        completed += 1
+                    # Heartbeat: slow items (e.g. while the limiter is throttled) keep their leases.
+                    if pending and time.monotonic() - renewed >= self.lease_ttl / 3:
+                        self.queue.renew(self.name, [futures[future] for future in pending], self.lease_ttl)
+                        renewed = time.monotonic()
+
+
+class Coordinator:
+    r"""Submit sweeps to a queue and merge their results into the finder cache.
+
+    Example:
+        .. code-block:: python
+            queue = SQLiteQueue("sweep.db")
+            coordinator = Coordinator(queue)
+            sweep = coordinator.submit("中国", date=7)
+            spawn_workers("sweep.db", 4)
+            coordinator.wait(sweep)
+            forecasts = coordinator.merge(sweep)
+    """
+
+    def __init__(self, queue: WorkQueue, finder=None):
+        if finder is None:
+            from .sunshine_finder import SunshineFinder as finder
+        self.queue = queue
+        self.finder = finder
+
+    def submit(self, location: str = "中国", date: Union[int, str] = None, sweep: Optional[str] = None) -> str:
+        from .sunshine_finder import location_to_cities
+
+        sweep = sweep or datetime.now().strftime("%Y%m%d%H%M%S%f")
+        date = self.finder.date if date is None else date
+        self.queue.put(sweep, location_to_cities(location, self.finder.tier), date)
+        return sweep
+
+    def wait(self, sweep: str, timeout: Optional[float] = None, poll: float = 0.5) -> Dict[str, int]:
+        """Block until no item of the sweep is pending or leased, and return the status counts."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            status = self.queue.status(sweep)
+            if status["pending"] == 0 and status["leased"] == 0:
+                return status
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Sweep {sweep} did not finish: {status}")
+            time.sleep(poll)
+
+    def merge(self, sweep: str) -> Dict[str, Dict]:
+        """Store the completed forecasts of the sweep in the finder."""
+        results = self.queue.results(sweep)
+        for city, forecast in results.items():
+            self.finder.store(city, forecast)
+        self.finder.feed.commit()
+        return results
+
+
+def run_worker(path: str, name: Optional[str] = None, lease_ttl: float = 60, batch: int = 8,
+               idle_timeout: Optional[float] = 5.0) -> int:
+    return Worker(SQLiteQueue(path), name, lease_ttl, batch).run(idle_timeout)
+
+
+def spawn_workers(path: str, count: int, **kwargs) -> List[multiprocessing.Process]:
+    """Start `count` local worker processes on a SQLite queue."""
+    processes = []
+    for _ in range(count):
+        process = multiprocessing.Process(target=run_worker, args=(path,), kwargs=kwargs, daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed WhereSunshine sweeps")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    worker = subparsers.add_parser("worker", help="lease and fetch work items")
+    worker.add_argument("--queue", required=True, help="SQLite queue file")
+    worker.add_argument("--lease-ttl", type=float, default=60)
+    worker.add_argument("--batch", type=int, default=8)
+    worker.add_argument("--idle-timeout", type=float, default=None, help="exit after this many idle seconds")
+
+    coordinator = subparsers.add_parser("coordinator", help="submit a sweep and wait for it")
+    coordinator.add_argument("--queue", required=True, help="SQLite queue file")
+    coordinator.add_argument("--location", default="中国")
+    coordinator.add_argument("--date", default="7", help="`n`, YYYYMMDD or YYYYMMDD-YYYYMMDD")
+    coordinator.add_argument("--workers", type=int, default=0, help="also start local worker processes")
+    coordinator.add_argument("--export", metavar="DIR", help="export the merged forecasts to DIR before exiting")
+
+    args = parser.parse_args(argv)
+    if args.mode == "worker":
+        print(run_worker(args.queue, lease_ttl=args.lease_ttl, batch=args.batch, idle_timeout=args.idle_timeout))
+        return
+
+    date = int(args.date) if args.date.isdigit() and len(args.date) < 8 else args.date
+    queue = SQLiteQueue(args.queue)
+    coordinator = Coordinator(queue)
+    sweep = coordinator.submit(args.location, date)
+    processes = spawn_workers(args.queue, args.workers)
+    status = coordinator.wait(sweep)
+    for process in processes:
+        process.join()
+    merged = coordinator.merge(sweep)
+    if args.export is not None:
+        coordinator.finder.export(args.export)
+    print(json.dumps({"sweep": sweep, "status": status, "merged": len(merged), "errors": queue.errors(sweep)},
+                     ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
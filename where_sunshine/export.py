@@ -0,0 +1,171 @@
+r"""Columnar snapshot export of the forecast cache.
+
+The cached daily forecasts are written partitioned by fetch date, as
+`<directory>/fetch_date=YYYY-MM-DD/part-<export time>.<ext>`. Every export
+adds new parts and never rewrites existing ones: a part holds the cities
+that still had a forecast of its fetch date at export time, and the
+latest part of a partition is the most recent state. Rows are produced
+by a generator and written in chunks, so an export never holds the
+snapshot as a list of dicts.
+
+Parquet and Arrow IPC require the optional `pyarrow` package
+(`pip install pyarrow`); without it the export falls back to CSV.
+
+Example:
+    .. code-block:: python
+        from where_sunshine import sunshine_finder
+
+        sunshine_finder.sunny_cities("中国")
+        sunshine_finder.export("snapshots", "parquet")
+"""
+import csv
+import os
+from datetime import datetime
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
+
+from .utils import GeoMap as geo_map
+
+COLUMNS = [
+    "city",
+    "province",
+    "region",
+    "location_id",
+    "date",
+    "weather_code",
+    "weather_text",
+    "tempMin",
+    "tempMax",
+    "link",
+]
+
+EXTENSIONS = {"parquet": "parquet", "arrow": "arrow", "csv": "csv"}
+
+
+def iter_rows(finder, cities: List[str]) -> Iterator[Tuple]:
+    """Yield one row tuple per city and day of the cached forecasts, in `COLUMNS` order."""
+    location_ids = finder.weather_server.location_ids
+    for city in cities:
+        forecast = finder.result[city]
+        province = geo_map.city_to_province(city)
+        region = geo_map.province_to_region(province)
+        location_id = location_ids.get((city, None), (None,))[0]
+        for day_weather in forecast["daily"]:
+            yield (
+                city,
+                province,
+                region,
+                location_id,
+                day_weather["date"],
+                day_weather.get("icon"),
+                day_weather["weather"],
+                _to_int(day_weather["tempMin"]),
+                _to_int(day_weather["tempMax"]),
+                forecast["link"],
+            )
+
+
+def iter_chunks(rows: Iterator[Tuple], chunk_size: int) -> Iterator[List[Tuple]]:
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_snapshot(
+    finder,
+    directory: str,
+    output_format: Optional[str] = None,
+    chunk_size: int = 4096,
+) -> List[str]:
+    """Write the forecast cache of a finder as partitioned columnar files.
+
+    Args:
+        finder: A `SunshineFinder` (class) holding the forecast cache.
+        directory (str): Root directory of the partitions.
+        output_format (Optional[str]): "parquet", "arrow" or "csv". Defaults
+            to "parquet" when `pyarrow` is installed and "csv" otherwise.
+        chunk_size (int): Number of rows written at a time.
+
+    Returns:
+        List[str]: Paths of the written files.
+    """
+    pa = _import_pyarrow()
+    if output_format is None:
+        output_format = "csv" if pa is None else "parquet"
+    if output_format not in EXTENSIONS:
+        raise ValueError(f"Invalid output format: {output_format}")
+    if output_format != "csv" and pa is None:
+        raise ImportError(
+            f"Exporting to {output_format} requires pyarrow, install it with `pip install pyarrow`."
+        )
+
+    partitions = {}
+    for city in list(finder.result):
+        partitions.setdefault(finder.fetch_dates.get(city), []).append(city)
+
+    part = f"part-{datetime.now():%Y%m%dT%H%M%S%f}.{EXTENSIONS[output_format]}"
+    paths = []
+    for fetch_date, cities in sorted(partitions.items(), key=lambda item: str(item[0])):
+        partition = os.path.join(directory, f"fetch_date={fetch_date or 'unknown'}")
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, part)
+        chunks = iter_chunks(iter_rows(finder, cities), chunk_size)
+        if output_format == "csv":
+            _write_csv(path, chunks)
+        else:
+            _write_arrow(pa, path, chunks, output_format)
+        paths.append(path)
+    return paths
+
+
+def _write_csv(path, chunks):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for chunk in chunks:
+            writer.writerows(chunk)
+
+
+def _write_arrow(pa, path, chunks, output_format):
+    schema = pa.schema([
+        ("city", pa.string()),
+        ("province", pa.string()),
+        ("region", pa.string()),
+        ("location_id", pa.string()),
+        ("date", pa.string()),
+        ("weather_code", pa.string()),
+        ("weather_text", pa.string()),
+        ("tempMin", pa.int32()),
+        ("tempMax", pa.int32()),
+        ("link", pa.string()),
+    ])
+    if output_format == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(path, schema)
+    else:
+        writer = pa.ipc.new_file(path, schema)
+    try:
+        for chunk in chunks:
+            columns = [list(column) for column in zip(*chunk)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+    finally:
+        writer.close()
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,154 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+
+class Stage:
+    r"""A pipeline stage calling one endpoint per item.
+
+    Args:
+        name (str): Name of the stage, also the key of its result.
+        fn (Callable): Called with an item, returns the endpoint response.
+        concurrency (int): Number of items processed at the same time.
+        upstream (Optional[str]): Name of the stage feeding this one. Stages
+            without upstream receive every item of the pipeline.
+        predicate (Optional[Callable]): Called with the response. Items for
+            which it returns False are not passed downstream and are dropped
+            from the result.
+        key (Optional[Callable]): Maps an item to its cache key, e.g. a
+            location ID. Defaults to the item itself. Items with the key of an
+            item in flight wait for its response instead of calling `fn`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any], Any],
+        concurrency: int = 4,
+        upstream: Optional[str] = None,
+        predicate: Optional[Callable[[Any], bool]] = None,
+        key: Optional[Callable[[Any], Hashable]] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.concurrency = concurrency
+        self.upstream = upstream
+        self.predicate = predicate
+        self.key = key
+        self.cache: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+
+    def __call__(self, item):
+        key = item if self.key is None else self.key(item)
+        with self._lock:
+            if key in self.cache:
+                return self.cache[key]
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            response = self.fn(item)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(response)
+            with self._lock:
+                self.cache[key] = response
+            return response
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+class Pipeline:
+    r"""Dataflow executor over endpoint stages.
+
+    Every stage owns a thread pool sized by its concurrency. An item is
+    submitted to a downstream stage as soon as it passes its upstream stage,
+    so downstream requests overlap with the upstream sweep, and items
+    filtered out upstream are never sent downstream.
+
+    Example:
+        .. code-block:: python
+            pipeline = Pipeline([
+                Stage("daily", fetch_daily, concurrency=8, predicate=is_sunny),
+                Stage("aqi", fetch_aqi, upstream="daily"),
+                Stage("indices", fetch_indices, upstream="daily"),
+            ])
+            result = pipeline.run(["北京市", "天津市"])
+            # result = {"北京市": {"daily": ..., "aqi": ..., "indices": ...}}
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        self.downstream = {name: [] for name in self.stages}
+        self.sources = []
+        for stage in stages:
+            if stage.upstream is None:
+                self.sources.append(stage)
+            else:
+                self.downstream[stage.upstream].append(stage)
+
+    def run(self, items: Iterable[Hashable]) -> Dict[Hashable, Dict[str, Any]]:
+        """Run the items through every stage and return the responses per item.
+
+        The first exception raised by a stage stops the items not processed
+        yet, and is re-raised once the items in flight have finished.
+        """
+        results: Dict[Hashable, Dict[str, Any]] = {}
+        rejected = set()
+        errors = []
+        pending = 0
+        lock = threading.Condition()
+        executors = {
+            name: ThreadPoolExecutor(max_workers=stage.concurrency, thread_name_prefix=name)
+            for name, stage in self.stages.items()
+        }
+
+        def submit(stage, item):
+            nonlocal pending
+            with lock:
+                pending += 1
+            executors[stage.name].submit(process, stage, item)
+
+        def process(stage, item):
+            nonlocal pending
+            try:
+                if errors:
+                    return
+                response = stage(item)
+                passed = stage.predicate is None or stage.predicate(response)
+                with lock:
+                    results.setdefault(item, {})[stage.name] = response
+                    if not passed:
+                        rejected.add(item)
+                if passed and not errors:
+                    for child in self.downstream[stage.name]:
+                        submit(child, item)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+            finally:
+                with lock:
+                    pending -= 1
+                    lock.notify_all()
+
+        try:
+            for item in items:
+                for stage in self.sources:
+                    submit(stage, item)
+            with lock:
+                while pending:
+                    lock.wait()
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+
+        if errors:
+            raise errors[0]
+        return {item: result for item, result in results.items() if item not in rejected}
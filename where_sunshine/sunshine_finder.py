@@ -1,14 +1,41 @@
+import logging
+import math
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Optional, Union
-from rich.progress import track
+from typing import Callable, Optional, Union
+from qweather import astronomy
+from qweather.utils import concurrency, tracing
 from .weather_server import WeatherServer
 from .utils import GeoMap as geo_map
-from .utils import format_date
+from .delta import DeltaFeed, Subscription
+from .export import export_snapshot
+from .pipeline import Pipeline, Stage
+from .utils import find_windows, format_date, match_weather
+from .views import MaterializedViews, View
+
+logger = logging.getLogger(__name__)
+
+
+class LazyWeatherServer:
+    """Create the shared `WeatherServer` on first access.
+
+    Creating the server loads the `qweather` API clients (and `requests`),
+    which is deferred so that importing `where_sunshine` stays cheap.
+    """
+
+    def __get__(self, instance, owner):
+        server = WeatherServer()
+        owner.weather_server = server
+        return server
 
 
 class SunshineFinder:
     """Find all sunny cities in China.
 
+    Where a bulk endpoint can stand in for one request per city (e.g. the
+    warning city list), the finder uses the bulk endpoint.
+
     Args:
         date (Union[int, str], optional):
             Date to query weather:
@@ -24,36 +51,181 @@ class SunshineFinder:
 
         sunny_cities = sunshine_finder.sunny_cities("华东")
     """
-    weather_server = WeatherServer()
+    weather_server = LazyWeatherServer()
     date: Union[int, str] = 7
+    tier: str = "city"  #: "city" (prefecture level) or "county", which needs a user-provided `data/counties_cn.json`
     result: dict = dict()
+    fetch_dates: dict = dict()  #: Date on which each cached city forecast was fetched
+    hourly_result: dict = dict()
+    warning_ids: set = set()  #: Location IDs under a weather warning
+    warning_time: Optional[float] = None
+    warning_ttl: int = 600  #: Seconds before the warning list is fetched again
+    stage_concurrency: dict = {"daily": 8, "aqi": 4, "indices": 4, "sun": 4}
+    enrich_cache: dict = dict()  #: Enrichment responses per stage and location ID
+    views = MaterializedViews()
+    refiner: Optional[ThreadPoolExecutor] = None  #: Background executor of `refine`
+    feed = DeltaFeed()
+    progress: bool = True  #: Show a progress bar while fetching
 
     def fetch_weather(
         self,
         location: str,
         date: Optional[Union[int, str]] = None,
+        callback: Optional[Callable[[str, dict], None]] = None,
     ):
-        query_dates = format_date(self.date if date is None else date)
-        cities = location_to_cities(location)
-        for city in track(cities, description="Fetching"):
-            if city not in self.result:
-                self.result[city] = {}
-                response = self.weather_server(city, date=date)
-                self.result[city]["daily"] = response["daily"]
-                self.result[city]["link"] = response["link"] 
-            else:
-                dates = [
-                    datetime.strptime(day_weather["date"], "%Y-%m-%d").date()
-                    for day_weather in self.result[city]["daily"]
-                ]
-                if query_dates[-1] > dates[-1]:
-                    response = self.weather_server(city, date=date)
-                    self.result[city]["daily"] = response["daily"]
-                    self.result[city]["link"] = response["link"]
+        """Return `{city: forecast}` of the location, fetching the stale cities.
+
+        `callback(city, forecast)` is called on the calling thread as soon as
+        each stale city has been fetched, to stream results.
+        """
+        date = self.date if date is None else date
+        query_dates = format_date(date)
+        cities = location_to_cities(location, self.tier)
+        stale = [city for city in cities if not is_fresh(self.result.get(city), query_dates)]
+        try:
+            with tracing.span("finder.fetch", cities=len(stale)):
+                for city, response in fetch_concurrently(self.forecast, stale, date, self.progress):
+                    self.store(city, {"daily": response["daily"], "link": response["link"]})
+                    if callback is not None:
+                        callback(city, self.result[city])
+        finally:
+            self.feed.commit()
         return {city: self.result[city] for city in cities}
-    
+
+    def fetch_hourly(
+        self,
+        cities: list[str],
+        date: Optional[Union[int, str]] = None,
+    ):
+        date = 1 if date is None else date
+        query_dates = format_date(date)
+        today = datetime.now().date()
+        stale = []
+        for city in cities:
+            cached = self.hourly_result.get(city)
+            if cached is None or cached["fetch_date"] != today or not set(query_dates) <= cached["dates"]:
+                stale.append(city)
+
+        # Hours are cached from today up to the last queried date, so any
+        # earlier date is answered from the same response.
+        period = f"{today:%Y%m%d}-{max(query_dates[-1], today):%Y%m%d}"
+        for city, response in fetch_concurrently(self.weather_server.hourly, stale, period, self.progress):
+            self.hourly_result[city] = {
+                "hourly": response["hourly"],
+                "link": response["link"],
+                "dates": {datetime.fromisoformat(hour["time"]).date() for hour in response["hourly"]} | {today},
+                "fetch_date": today,
+            }
+        query_dates = set(query_dates)
+        return {
+            city: {
+                "hourly": [
+                    hour for hour in self.hourly_result[city]["hourly"]
+                    if datetime.fromisoformat(hour["time"]).date() in query_dates
+                ],
+                "link": self.hourly_result[city]["link"],
+            }
+            for city in cities
+        }
+
+    @classmethod
+    def prefetch(cls, queries: list) -> dict:
+        """Fetch the forecasts needed by many `(location, date)` queries at once.
+
+        The cities of all queries are merged and every city is fetched at most
+        once, for the whole period spanned by the queries, so the queries can
+        then be answered from the cache.
+
+        Returns:
+            dict: `{city: forecast}` of all the cities of the queries.
+        """
+        cities, dates = dict(), set()
+        for location, date in queries:
+            dates.update(format_date(cls.date if date is None else date))
+            for city in location_to_cities(location, cls.tier):
+                cities[city] = None
+        if not dates:
+            return {}
+        period = f"{min(dates):%Y%m%d}-{max(dates):%Y%m%d}"
+        query_dates = format_date(period)
+        stale = [
+            city for city in cities
+            if not is_fresh(cls.result.get(city), query_dates)
+            or cls.result[city]["daily"][0]["date"] > query_dates[0].isoformat()
+        ]
+        try:
+            with tracing.span("finder.fetch", cities=len(stale)):
+                for city, response in fetch_concurrently(cls.forecast, stale, period, cls.progress):
+                    cls.store(city, {"daily": response["daily"], "link": response["link"]})
+        finally:
+            cls.feed.commit()
+        return {city: cls.result[city] for city in cities}
+
+    @classmethod
+    def forecast(cls, location: str, date: Union[int, str] = None) -> dict:
+        """Fetch the daily forecast of a city, or of a `"city/county"` labelled county."""
+        return cls.weather_server(location, date=cls.date if date is None else date)
+
+    @classmethod
+    def store(cls, city: str, forecast: dict):
+        """Cache the daily forecast of a city, update its views and record its changes."""
+        previous = cls.result.get(city)
+        cls.result[city] = forecast
+        cls.fetch_dates[city] = datetime.now().date()
+        cls.views.update(city, forecast)
+        cls.feed.record(city, previous, forecast)
+
+    @classmethod
+    def view(
+        cls,
+        location="中国",
+        weather: str = "晴",
+        date: Union[int, str] = None,
+        callback: Optional[Callable[[str, dict], None]] = None,
+    ) -> View:
+        """Return the materialized view of the matching cities in the location.
+
+        The first query for a `(location, weather, date)` sweeps the location
+        and materializes the view. Later queries are a lookup, and the view is
+        kept up to date as city forecasts are refreshed by any query.
+
+        Args:
+            location (str, optional):
+                The cities location. It can be a region, a province, or a city.
+                Defaults to "中国".
+            weather (str, optional):
+                "晴" or "多云". Defaults to "晴".
+            date (Union[int, str], optional):
+                Date to query weather, see `sunny_cities`.
+            callback (Optional[Callable], optional):
+                Called with every city fetched by the sweep, see `fetch_weather`.
+        """
+        date = cls.date if date is None else date
+        dates = format_date(date)
+        view = cls.views.get(location, weather, dates, cls.tier)
+        if view is None:
+            forecasts = cls.fetch_weather(cls, location, date, callback)
+            with tracing.span("finder.filter", location=location, weather=weather):
+                view = cls.views.build(location, weather, dates, forecasts, cls.tier)
+        return view
+
     @classmethod
-    def sunny_cities(cls, location="中国", date: Union[int, str] = None) -> dict:
+    def export(cls, directory: str, output_format: Optional[str] = None, chunk_size: int = 4096) -> list[str]:
+        """Export the cached daily forecasts as columnar files, see `where_sunshine.export`."""
+        return export_snapshot(cls, directory, output_format, chunk_size)
+
+    @classmethod
+    def subscribe(cls, callback: Optional[Callable[[dict], None]] = None) -> Subscription:
+        """Subscribe to the sweep-to-sweep changes of sunny cities, see `DeltaFeed`."""
+        return cls.feed.subscribe(callback)
+
+    @classmethod
+    def sunny_cities(
+        cls,
+        location="中国",
+        date: Union[int, str] = None,
+        warnings: Optional[str] = None,
+    ) -> dict:
         """Return a list of sunny cities and their weather base on the location.
 
         Args:
@@ -66,18 +238,27 @@ class SunshineFinder:
                     1-30 for standard and premium subscription API).
                     - Specific date in `YYYYMMDD` format (e.g., "20240623").
                     - Period in `YYYYMMDD-YYYYMMDD` format (e.g., "20240623-20240627").
+            warnings (Optional[str], optional):
+                "annotate" to mark cities under a weather warning with
+                `"warned": True`, "exclude" to drop them. Defaults to None.
         """
         fetch_result = cls.fetch_weather(cls, location, date)
         result = dict()
-        for city, daily_weather in fetch_result.items():
-            for day_weather in daily_weather["daily"]:
-                if day_weather["weather"] == "晴":
-                    result[city] = daily_weather
-                    continue
-        return result
+        with tracing.span("finder.filter", location=location):
+            for city, daily_weather in fetch_result.items():
+                for day_weather in daily_weather["daily"]:
+                    if day_weather["weather"] == "晴":
+                        result[city] = daily_weather
+                        continue
+        return cls.apply_warnings(result, warnings)
     
     @classmethod
-    def cloudy_cities(cls, location="中国", date: Union[int, str] = None) -> dict:
+    def cloudy_cities(
+        cls,
+        location="中国",
+        date: Union[int, str] = None,
+        warnings: Optional[str] = None,
+    ) -> dict:
         """Return a list of cloudy cities and their weather base on the location.
 
         Args:
@@ -90,28 +271,467 @@ class SunshineFinder:
                     1-30 for standard and premium subscription API).
                     - Specific date in `YYYYMMDD` format (e.g., "20240623").
                     - Period in `YYYYMMDD-YYYYMMDD` format (e.g., "20240623-20240627").
+            warnings (Optional[str], optional):
+                "annotate" to mark cities under a weather warning with
+                `"warned": True`, "exclude" to drop them. Defaults to None.
         """
         fetch_result = cls.fetch_weather(cls, location, date)
         result = dict()
-        for city, daily_weather in fetch_result.items():
-            for day_weather in daily_weather["daily"]:
-                if "云" in day_weather["weather"]:
-                    result[city] = daily_weather
-                    continue
+        with tracing.span("finder.filter", location=location):
+            for city, daily_weather in fetch_result.items():
+                for day_weather in daily_weather["daily"]:
+                    if "云" in day_weather["weather"]:
+                        result[city] = daily_weather
+                        continue
+        return cls.apply_warnings(result, warnings)
+
+    @classmethod
+    def warned_cities(cls, location="中国", refresh: bool = False) -> list[str]:
+        """Return the cities in the location under a weather warning.
+
+        The nationwide warning list is fetched with one `WarningCityListAPI`
+        request and cached for `warning_ttl` seconds, instead of calling
+        `WarningWeatherAPI` for every city. Cities are joined to the list
+        through the location IDs cached by `WeatherServer`. A city counts as
+        warned when its own ID or any county of its prefecture is listed,
+        see `prefecture_code`. IDs of cities not cached yet are looked up
+        once, see `lookup_locations`.
+
+        Args:
+            location (str, optional):
+                The cities location. It can be a region, a province, or a city.
+                Defaults to "中国".
+            refresh (bool, optional):
+                Fetch the warning list even if the cached one is fresh.
+        """
+        return cls.filter_warned(location_to_cities(location, cls.tier), refresh)
+
+    @classmethod
+    def filter_warned(cls, cities: list[str], refresh: bool = False) -> list[str]:
+        """Return the cities under a weather warning, see `warned_cities`."""
+        if refresh or cls.warning_time is None or time.monotonic() - cls.warning_time > cls.warning_ttl:
+            cls.warning_ids = cls.weather_server.warning_location_ids()
+            cls.warning_time = time.monotonic()
+        server = cls.weather_server
+        cls.lookup_locations(cities)
+        prefectures = {prefecture_code(location_id) for location_id in cls.warning_ids}
+        warned = []
+        for city in cities:
+            location_id = server.location_ids[(city, None)][0]
+            if location_id in cls.warning_ids or prefecture_code(location_id) in prefectures:
+                warned.append(city)
+        return warned
+
+    @classmethod
+    def lookup_locations(cls, cities: list[str]):
+        """Look up the location IDs and coordinates of the cities not cached yet.
+
+        The lookups run concurrently and are saved by
+        `WeatherServer.save_locations`, so a cold national query costs one
+        CityLookup request per city once, not once per process.
+        """
+        server = cls.weather_server
+        uncached = [city for city in cities if (city, None) not in server.location_ids]
+        if not uncached:
+            return
+        try:
+            for _ in fetch_concurrently(lambda city, date: server.location_id(city), uncached, None, progress=False):
+                pass
+        finally:
+            server.save_locations()
+
+    @classmethod
+    def apply_warnings(cls, result: dict, warnings: Optional[str] = None) -> dict:
+        """Annotate or exclude warned cities of a query result, see `sunny_cities`."""
+        if warnings is None or not result:
+            return result
+        warned = set(cls.filter_warned(list(result)))
+        if warnings == "exclude":
+            return {city: weather for city, weather in result.items() if city not in warned}
+        return {city: {**weather, "warned": city in warned} for city, weather in result.items()}
+
+    @classmethod
+    def sunny_windows(
+        cls,
+        location="中国",
+        date: Union[int, str] = 1,
+        hours: int = 3,
+        weather: str = "晴",
+    ) -> dict:
+        """Return cities with contiguous sunny (or cloudy) hours and the windows.
+
+        The query runs in two stages. Daily forecasts first narrow the location
+        down to cities with a matching day, then hourly forecasts are fetched
+        for those candidates only and scanned for windows of `hours` or more
+        consecutive matching hours.
+
+        Args:
+            location (str, optional):
+                The cities location. It can be a region, a province, or a city.
+                Defaults to "中国".
+            date (Union[int, str], optional):
+                Date to query weather, within the next 7 days. Defaults to today.
+            hours (int, optional):
+                Minimum length of a window in hours. Defaults to 3.
+            weather (str, optional):
+                "晴" or "多云". Defaults to "晴".
+        """
+        if weather == "多云":
+            candidates = cls.cloudy_cities(location, date)
+        else:
+            candidates = cls.sunny_cities(location, date)
+        fetch_result = cls.fetch_hourly(cls, list(candidates), date)
+        result = dict()
+        for city, hourly_weather in fetch_result.items():
+            windows = find_windows(hourly_weather["hourly"], weather, hours)
+            if windows:
+                result[city] = {"windows": windows, "link": hourly_weather["link"]}
         return result
 
+    @classmethod
+    def daylight_hours(cls, location="中国", date: Union[int, str] = None) -> dict:
+        """Return daylight hours of the cities in the location on every date.
+
+        Sunrise and sunset are computed locally by `qweather.astronomy`, so
+        only cities whose coordinates are not cached yet cost a city lookup,
+        once, see `lookup_locations`.
+
+        Args:
+            location (str, optional):
+                The cities location. It can be a region, a province, or a city.
+                Defaults to "中国".
+            date (Union[int, str], optional):
+                Date to query, see `sunny_cities`.
+
+        Returns:
+            dict: `{city: {"YYYY-MM-DD": hours}}`.
+        """
+        cities = location_to_cities(location, cls.tier)
+        dates = format_date(cls.date if date is None else date)
+        cls.lookup_locations(cities)
+        coordinates = [cls.weather_server.coordinates(city) for city in cities]
+        hours = astronomy.daylight_hours(coordinates, dates)
+        return {
+            city: {day.isoformat(): value for day, value in zip(dates, city_hours)}
+            for city, city_hours in zip(cities, hours)
+        }
+
+    @classmethod
+    def enrich(
+        cls,
+        location="中国",
+        date: Union[int, str] = None,
+        weather: str = "晴",
+        concurrency: Optional[dict] = None,
+    ) -> dict:
+        """Return matching cities with their air quality, weather indices and sun times.
+
+        The daily sweep and the enrichment requests run as one pipeline, see
+        `where_sunshine.pipeline`. A city is sent to the AQI, indices and sun
+        stages as soon as its daily forecast matches, so enrichment overlaps
+        with the sweep and only matching cities are enriched. AQI and indices
+        responses are cached per location ID for the day they were fetched,
+        sun times per location ID and date.
+
+        Args:
+            location (str, optional):
+                The cities location. It can be a region, a province, or a city.
+                Defaults to "中国".
+            date (Union[int, str], optional):
+                Date to query weather, see `sunny_cities`.
+            weather (str, optional):
+                "晴" or "多云". Defaults to "晴".
+            concurrency (Optional[dict], optional):
+                Concurrency per stage name ("daily", "aqi", "indices", "sun").
+
+        Returns:
+            dict: `{city: {"daily", "link", "aqi", "indices", "sun"}}`.
+        """
+        date = cls.date if date is None else date
+        query_dates = format_date(date)
+        concurrency = {**cls.stage_concurrency, **(concurrency or {})}
+        server = cls.weather_server
+
+        def daily(city):
+            if not is_fresh(cls.result.get(city), query_dates):
+                response = cls.forecast(city, date=date)
+                cls.store(city, {"daily": response["daily"], "link": response["link"]})
+            return cls.result[city]
+
+        def matches(daily_weather):
+            return any(match_weather(day["weather"], weather) for day in daily_weather["daily"])
+
+        sun_date = query_dates[0].strftime("%Y%m%d")
+        today = datetime.now().date()
+        for name in ("aqi", "indices"):
+            # Forecasts of previous days are stale.
+            cache = cls.enrich_cache.get(name, {})
+            for key in [key for key in cache if key[1] != today]:
+                del cache[key]
+        enrich_stages = {
+            "aqi": (
+                lambda city: server.aqi_client.invoke(location=server.location_id(city))["daily"],
+                lambda city: (server.location_id(city), today),
+            ),
+            "indices": (
+                lambda city: server.indices_client.invoke(
+                    days="1d", location=server.location_id(city), type="0", lang=server.lang
+                )["daily"],
+                lambda city: (server.location_id(city), today),
+            ),
+            "sun": (
+                lambda city: server.sun_client.invoke(
+                    location="{},{}".format(*server.coordinates(city)), date=sun_date
+                ),
+                lambda city: (server.location_id(city), sun_date),
+            ),
+        }
+        stages = [Stage("daily", daily, concurrency["daily"], predicate=matches)]
+        for name, (fn, key) in enrich_stages.items():
+            stage = Stage(name, fn, concurrency[name], upstream="daily", key=key)
+            stage.cache = cls.enrich_cache.setdefault(name, {})
+            stages.append(stage)
+
+        try:
+            pipeline_result = Pipeline(stages).run(location_to_cities(location, cls.tier))
+        finally:
+            cls.feed.commit()
+        result = dict()
+        for city, responses in pipeline_result.items():
+            result[city] = dict(responses.pop("daily"), **responses)
+        return result
+
+    @classmethod
+    def overview(
+        cls,
+        date: Union[int, str] = None,
+        weather: str = "晴",
+        samples: int = 1,
+        refine: bool = True,
+        min_confidence: float = 0.9,
+    ) -> dict:
+        """Return an approximate per-province estimate of the matching cities.
+
+        Only `samples` representative cities per province are fetched (the
+        capital first, then cities spread over the province list), about 10%
+        of a national sweep with the default of one. Cities already in the
+        cache are used as well, so estimates become exact as the cache fills.
+        Provinces whose samples disagree (some match and some don't) and
+        whose confidence is below `min_confidence` are refined in the
+        background, least confident first, see `refine`. With one sample per
+        province the samples never disagree, so nothing is refined and
+        drilled-into provinces are refined by calling `refine`.
+
+        Args:
+            date (Union[int, str], optional):
+                Date to query weather, see `sunny_cities`.
+            weather (str, optional):
+                "晴" or "多云". Defaults to "晴".
+            samples (int, optional):
+                Representative cities fetched per province. Defaults to 1.
+            refine (bool, optional):
+                Refine provinces with mixed samples in the background.
+                Defaults to True.
+            min_confidence (float, optional):
+                Confidence below which a province with mixed samples is
+                refined. Defaults to 0.9.
+
+        Returns:
+            dict: `{province: {"region", "ratio", "sampled", "total",
+            "confidence", "exact"}}`, where `ratio` is the estimated share of
+            matching cities and `confidence` is one minus the half-width of its
+            95% interval.
+        """
+        date = cls.date if date is None else date
+        query_dates = format_date(date)
+        provinces = {province: geo_map.province_to_cities(province) for province in geo_map.all_provinces()}
+
+        wanted = []
+        for cities in provinces.values():
+            for city in representatives(cities, samples):
+                if not is_fresh(cls.result.get(city), query_dates):
+                    wanted.append(city)
+        try:
+            with tracing.span("finder.fetch", cities=len(wanted)):
+                for city, response in fetch_concurrently(cls.forecast, wanted, date, cls.progress):
+                    cls.store(city, {"daily": response["daily"], "link": response["link"]})
+        finally:
+            cls.feed.commit()
+
+        result = dict()
+        for province, cities in provinces.items():
+            sampled = [city for city in cities if is_fresh(cls.result.get(city), query_dates)]
+            matched = sum(
+                any(
+                    match_weather(day["weather"], weather)
+                    for day in cls.result[city]["daily"]
+                    if datetime.strptime(day["date"], "%Y-%m-%d").date() in query_dates
+                )
+                for city in sampled
+            )
+            ratio = matched / len(sampled) if sampled else 0.0
+            result[province] = {
+                "region": geo_map.province_to_region(province),
+                "ratio": ratio,
+                "sampled": len(sampled),
+                "total": len(cities),
+                "confidence": estimate_confidence(ratio, len(sampled), len(cities)),
+                "exact": len(sampled) == len(cities),
+            }
+        uncertain = sorted(
+            (
+                province for province, estimate in result.items()
+                if 0 < estimate["ratio"] < 1 and estimate["confidence"] < min_confidence
+            ),
+            key=lambda province: result[province]["confidence"],
+        )
+        if refine and uncertain:
+            cls.refine(uncertain, date)
+        return result
+
+    @classmethod
+    def refine(cls, provinces: list[str], date: Union[int, str] = None) -> Future:
+        """Fetch every city of the provinces in the background.
+
+        Used for provinces the user drills into or with mixed overview
+        samples. Refined forecasts go through `store`, so views, deltas and
+        later overviews pick them up.
+
+        Returns:
+            Future: Resolves to the `{city: forecast}` of the provinces. A
+            failed refinement is logged, and the forecasts fetched before
+            the failure are kept.
+        """
+        date = cls.date if date is None else date
+        query_dates = format_date(date)
+
+        def run():
+            cities = [city for province in provinces for city in geo_map.province_to_cities(province)]
+            stale = [city for city in cities if not is_fresh(cls.result.get(city), query_dates)]
+            try:
+                for city, response in fetch_concurrently(cls.forecast, stale, date, progress=False):
+                    cls.store(city, {"daily": response["daily"], "link": response["link"]})
+            finally:
+                cls.feed.commit()
+            return {city: cls.result[city] for city in cities}
+
+        if cls.refiner is None:
+            cls.refiner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refine")
+        future = cls.refiner.submit(run)
+        future.add_done_callback(log_failure)
+        return future
+
+
+def log_failure(future: Future):
+    """Log the error of a background future nobody may wait for."""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Background refinement failed", exc_info=future.exception())
+
+
+def representatives(cities: list[str], samples: int) -> list[str]:
+    """Pick `samples` cities spread over the list, starting with the first (the capital)."""
+    samples = min(samples, len(cities))
+    return [cities[len(cities) * i // samples] for i in range(samples)]
+
+
+def estimate_confidence(ratio: float, sampled: int, total: int, z: float = 1.96) -> float:
+    """One minus the half-width of the Wilson interval of a sampled ratio.
+
+    A finite population correction is applied, so a fully sampled province
+    has a confidence of 1.
+    """
+    if sampled == 0:
+        return 0.0
+    if sampled >= total:
+        return 1.0
+    denominator = 1 + z ** 2 / sampled
+    half_width = z * math.sqrt(ratio * (1 - ratio) / sampled + z ** 2 / (4 * sampled ** 2)) / denominator
+    half_width *= math.sqrt((total - sampled) / (total - 1))
+    return max(0.0, 1 - half_width)
+
+
+def is_fresh(daily_weather: Optional[dict], query_dates: list) -> bool:
+    """Whether a cached daily forecast covers the last queried date."""
+    if not daily_weather or not daily_weather["daily"]:
+        return False
+    last_date = datetime.strptime(daily_weather["daily"][-1]["date"], "%Y-%m-%d").date()
+    return query_dates[-1] <= last_date
+
+
+MUNICIPALITY_CODES = {"01", "02", "03", "04"}  #: Province codes of 北京, 上海, 天津 and 重庆
+
+
+def prefecture_code(location_id: str) -> str:
+    """Return the prefecture part of a QWeather location ID.
+
+    IDs are "101", then two digits each for the province, the city and the
+    county. The districts of a municipality take the city digits instead
+    (海淀 101010200 in 北京 101010100), so a municipality is one prefecture.
+    """
+    if location_id[3:5] in MUNICIPALITY_CODES:
+        return location_id[:5]
+    return location_id[:7]
+
+
+def fetch_concurrently(fn, cities, date, progress: bool = True):
+    """Call `fn(city, date=date)` for every city and yield `(city, response)`.
+
+    The in-flight request count is governed by the adaptive limiter in
+    `qweather.utils.http_client`, the pool only bounds the thread count.
+
+    The first error stops the requests not sent yet and is raised once the
+    responses of the requests in flight have been yielded, so the caller
+    can keep them. Inside a `concurrency.cancel_scope`, setting its event
+    does the same and raises `concurrency.Cancelled`.
+    """
+    if not cities:
+        return
+    cancelled = concurrency.cancel_event()
+    stop = concurrency.CancelEvent(cancelled)
+    tags = tracing.current_tags()
+    error = None
+    with ThreadPoolExecutor(max_workers=concurrency.max_workers()) as executor:
+        futures = {executor.submit(_call_in_scope, stop, tags, fn, city, date): city for city in cities}
+        completed = as_completed(futures)
+        if progress:
+            from rich.console import Console
+            from rich.progress import track
+
+            # Progress goes to stderr so that stdout stays machine readable.
+            completed = track(completed, total=len(futures), description="Fetching", console=Console(stderr=True))
+        for future in completed:
+            try:
+                response = future.result()
+            except concurrency.Cancelled:
+                continue
+            except Exception as e:
+                if error is None:
+                    error = e
+                    stop.set()
+                continue
+            yield futures[future], response
+    if error is not None:
+        raise error
+    if stop.is_set():
+        raise concurrency.Cancelled()
+
+
+def _call_in_scope(cancelled, tags, fn, city, date):
+    # Queued calls of a stopped fetch return without sending anything.
+    if cancelled.is_set():
+        raise concurrency.Cancelled()
+    with concurrency.cancel_scope(cancelled), tracing.tags(**tags):
+        return fn(city, date=date)
+
 
-def location_to_cities(location) -> list[str]:
-    """Return a list of cities base on the location."""
+@tracing.traced("finder.locate")
+def location_to_cities(location, tier: str = "city") -> list[str]:
+    """Return a list of cities (or counties with `tier="county"`) base on the location."""
+    if tier == "county" and not geo_map.all_counties():
+        raise ValueError("County data not found, add it to `data/counties_cn.json`.")
     if location == "中国":
-        return geo_map.all_cities()
-    for province in geo_map.all_provinces():
-        if location in province:
-            return geo_map.province_to_cities(province)
-    for region in geo_map.all_regions():
-        if location in region:
-            return geo_map.region_to_cities(region)
-    for city in geo_map.all_cities():
-        if location in city:
-            return [city]
-    raise ValueError("Can't find the location.")
+        return geo_map.all_counties() if tier == "county" else geo_map.all_cities()
+    cities = geo_map.locate(location, tier)
+    if not cities:
+        raise ValueError("Can't find the location.")
+    return cities
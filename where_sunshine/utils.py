@@ -1,7 +1,11 @@
+from array import array
+from bisect import bisect_left
 from datetime import datetime, timedelta
-from typing import Union, List
+from itertools import groupby
+from typing import Dict, Optional, Union, List
 
 import json
+import os
 
 
 def format_date(date: Union[int, str]) -> List[datetime.date]:
@@ -44,108 +48,287 @@ def format_date(date: Union[int, str]) -> List[datetime.date]:
     return result
 
 
+def match_weather(text: str, weather: str) -> bool:
+    """Return whether a weather text matches the queried weather ("晴" or "多云")."""
+    if weather == "多云":
+        return "云" in text
+    return text == weather
+
+
+def find_windows(hourly: List[dict], weather: str = "晴", min_hours: int = 1) -> List[dict]:
+    """Find contiguous runs of hours matching the queried weather.
+
+    Args:
+        hourly (List[dict]): Hourly weather with "time" and "weather" keys, in time order.
+        weather (str): "晴" or "多云".
+        min_hours (int): Minimum length of a run.
+
+    Returns:
+        List[dict]: Windows with "start", "end" and "hours" keys.
+    """
+    windows = []
+    index = 0
+    flags = [match_weather(hour["weather"], weather) for hour in hourly]
+    for matched, run in groupby(flags):
+        length = sum(1 for _ in run)
+        if matched and length >= min_hours:
+            windows.append({
+                "start": hourly[index]["time"],
+                "end": hourly[index + length - 1]["time"],
+                "hours": length,
+            })
+        index += length
+    return windows
+
+
+class GeoIndex:
+    r"""Compact hierarchical index of regions, provinces, cities and counties.
+
+    Nodes are integer IDs assigned in depth-first order, so the descendants
+    of a node are the contiguous ID range `[node, ends[node])`. Names are
+    kept in one list, and levels, parents and range ends in typed arrays.
+    A name index sorted by name answers exact and prefix lookups by binary
+    search, so memory grows linearly and lookups logarithmically with the
+    number of locations.
+
+    County names are not unique (e.g. 朝阳区 of 北京市 and of 长春市), so
+    counties are labelled with their city, as `"长春市/朝阳区"`.
+    """
+
+    REGION, PROVINCE, CITY, COUNTY = range(4)
+    SEPARATOR = "/"
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.levels = array("b")
+        self.parents = array("i")
+        self.ends = array("i")
+        self.by_level: Dict[int, List[int]] = {level: [] for level in range(4)}
+        self._sorted_names: List[str] = []
+        self._sorted_ids = array("i")
+
+    @classmethod
+    def build(cls, data: dict, counties: Optional[dict] = None) -> "GeoIndex":
+        """Build the index.
+
+        Args:
+            data (dict): `{region: {province: [city]}}`, as in `data/cities_cn.json`.
+            counties (Optional[dict]): `{province: {city: [county]}}`, as in the
+                optional `data/counties_cn.json`.
+        """
+        index = cls()
+        counties = counties or {}
+        for region, provinces in data.items():
+            region_id = index._add(region, cls.REGION, -1)
+            for province, cities in provinces.items():
+                province_id = index._add(province, cls.PROVINCE, region_id)
+                for city in cities:
+                    city_id = index._add(city, cls.CITY, province_id)
+                    for county in counties.get(province, {}).get(city, []):
+                        index.ends[index._add(county, cls.COUNTY, city_id)] = len(index.names)
+                    index.ends[city_id] = len(index.names)
+                index.ends[province_id] = len(index.names)
+            index.ends[region_id] = len(index.names)
+
+        order = sorted(range(len(index.names)), key=index.names.__getitem__)
+        index._sorted_names = [index.names[node] for node in order]
+        index._sorted_ids = array("i", order)
+        return index
+
+    def _add(self, name: str, level: int, parent: int) -> int:
+        node = len(self.names)
+        self.names.append(name)
+        self.levels.append(level)
+        self.parents.append(parent)
+        self.ends.append(node + 1)
+        self.by_level[level].append(node)
+        return node
+
+    def find(self, name: str, level: int) -> Optional[int]:
+        """Return the node of a level named `name`, or starting with or containing it.
+
+        Among several matches, the first one in data order wins.
+        """
+        start = bisect_left(self._sorted_names, name)
+        best = None
+        for position in range(start, len(self._sorted_names)):
+            if not self._sorted_names[position].startswith(name):
+                break
+            node = self._sorted_ids[position]
+            if self.levels[node] == level and (best is None or node < best):
+                best = node
+        if best is not None:
+            return best
+        for node in self.by_level[level]:
+            if name in self.names[node]:
+                return node
+        return None
+
+    def find_exact(self, name: str, level: int) -> Optional[int]:
+        position = bisect_left(self._sorted_names, name)
+        while position < len(self._sorted_names) and self._sorted_names[position] == name:
+            node = self._sorted_ids[position]
+            if self.levels[node] == level:
+                return node
+            position += 1
+        return None
+
+    def find_label(self, label: str) -> Optional[int]:
+        """Return the county node of a `"city/county"` label."""
+        city, _, county = label.partition(self.SEPARATOR)
+        city_node = self.find_exact(city, self.CITY)
+        if city_node is None:
+            return None
+        for node in self.descendants(city_node, self.COUNTY):
+            if self.names[node] == county:
+                return node
+        return None
+
+    def label(self, node: int) -> str:
+        if self.levels[node] == self.COUNTY:
+            return f"{self.names[self.parents[node]]}{self.SEPARATOR}{self.names[node]}"
+        return self.names[node]
+
+    def descendants(self, node: int, level: int) -> List[int]:
+        return [child for child in range(node + 1, self.ends[node]) if self.levels[child] == level]
+
+    def ancestor(self, node: int, level: int) -> int:
+        while self.levels[node] > level:
+            node = self.parents[node]
+        return node
+
+    def level_names(self, level: int) -> List[str]:
+        return [self.label(node) for node in self.by_level[level]]
+
+
 class GeoMap:
     data: dict = None
-    region2provinces: dict = None
-    province2cities: dict = None
+    counties: dict = None
+    index: GeoIndex = None
 
     @classmethod
     def region_to_provinces(cls, region: str) -> list[str]:
-        if cls.region2provinces is None:
-            cls._load_region2province()
-        for key, value in cls.region2provinces.items():
-            if region in key:
-                return value
-        return None
+        return cls._children(region, GeoIndex.REGION, GeoIndex.PROVINCE)
 
     @classmethod
     def province_to_cities(cls, province: str) -> list[str]:
-        if cls.province2cities is None:
-            cls._load_province2cities()
-        for key, value in cls.province2cities.items():
-            if province in key:
-                return value
-        return None
+        return cls._children(province, GeoIndex.PROVINCE, GeoIndex.CITY)
+
+    @classmethod
+    def city_to_counties(cls, city: str) -> list[str]:
+        return cls._children(city, GeoIndex.CITY, GeoIndex.COUNTY)
+
+    @classmethod
+    def province_to_capital(cls, province: str) -> str:
+        """Return the capital of a province, listed first in the geo data."""
+        cities = cls.province_to_cities(province)
+        return cities[0] if cities else None
 
     @classmethod
     def province_to_region(cls, province: str) -> str:
-        query_province = province
-        if cls.region2provinces is None:
-            cls._load_region2province()
-        for region, provinces in cls.region2provinces.items():
-            for province in provinces:
-                if query_province in province:
-                    return region
-        return None
+        return cls._ancestor(province, GeoIndex.PROVINCE, GeoIndex.REGION)
 
     @classmethod
     def city_to_province(cls, city: str) -> str:
-        query_city = city
-        if cls.province2cities is None:
-            cls._load_province2cities()
-        for province, cities in cls.province2cities.items():
-            for city in cities:
-                if query_city in city:
-                    return province
-        return None
+        """Return the province of a city, or of a county."""
+        return cls._ancestor(city, GeoIndex.CITY, GeoIndex.PROVINCE)
 
     @classmethod
     def city_to_region(cls, city: str) -> str:
-        province = cls.city_to_province(city)
-        return cls.province_to_region(province)
+        """Return the region of a city, or of a county."""
+        return cls._ancestor(city, GeoIndex.CITY, GeoIndex.REGION)
+
+    @classmethod
+    def county_to_city(cls, county: str) -> str:
+        """Return the city of a county, preferably given as a `"city/county"` label."""
+        return cls._ancestor(county, GeoIndex.COUNTY, GeoIndex.CITY)
 
     @classmethod
     def region_to_cities(cls, region: str) -> list[str]:
-        provinces = cls.region_to_provinces(region)
-        cities = []
-        for province in provinces:
-            cities.extend(cls.province_to_cities(province))
-        return cities
+        return cls._children(region, GeoIndex.REGION, GeoIndex.CITY)
+
+    @classmethod
+    def to_counties(cls, location: str, level: int) -> list[str]:
+        """Return the counties of a region, province or city."""
+        return cls._children(location, level, GeoIndex.COUNTY)
+
+    @classmethod
+    def locate(cls, location: str, tier: str = "city") -> list[str]:
+        """Return the cities (or counties with `tier="county"`) of a location.
+
+        The location is matched as a province, a region, a city and, for the
+        county tier, a county, in this order.
+        """
+        index = cls._load_index()
+        target = GeoIndex.COUNTY if tier == "county" else GeoIndex.CITY
+        for level in (GeoIndex.PROVINCE, GeoIndex.REGION, GeoIndex.CITY, GeoIndex.COUNTY):
+            if level > target:
+                break
+            node = cls._find(index, location, level)
+            if node is not None:
+                if level == target:
+                    return [index.label(node)]
+                return [index.label(child) for child in index.descendants(node, target)]
+        return None
 
     @classmethod
     def all_cities(cls) -> list[str]:
-        if cls.data is None:
-            cls._load_data()
-        cities_list = []
-        for region, provinces in cls.data.items():
-            for province, cities in provinces.items():
-                cities_list.extend(cities)
-        return cities_list
+        return cls._load_index().level_names(GeoIndex.CITY)
 
     @classmethod
     def all_provinces(cls) -> list[str]:
-        if cls.data is None:
-            cls._load_data()
-        provinces_list = []
-        for region, provinces in cls.data.items():
-            provinces_list.extend(list(provinces.keys()))
-        return provinces_list
+        return cls._load_index().level_names(GeoIndex.PROVINCE)
 
     @classmethod
     def all_regions(cls) -> list[str]:
-        if cls.data is None:
-            cls._load_data()
-        regions_list = list(cls.data.keys())
-        return regions_list
+        return cls._load_index().level_names(GeoIndex.REGION)
 
     @classmethod
-    def _load_region2province(cls):
-        if cls.data is None:
-            cls._load_data()
-        cls.region2provinces = {}
-        for region, provinces in cls.data.items():
-            cls.region2provinces[region] = list(provinces.keys())
+    def all_counties(cls) -> list[str]:
+        return cls._load_index().level_names(GeoIndex.COUNTY)
 
     @classmethod
-    def _load_province2cities(cls):
-        if cls.data is None:
+    def _children(cls, name: str, level: int, child_level: int) -> list[str]:
+        index = cls._load_index()
+        node = index.find(name, level)
+        if node is None:
+            return None
+        return [index.label(child) for child in index.descendants(node, child_level)]
+
+    @classmethod
+    def _ancestor(cls, name: str, level: int, ancestor_level: int) -> str:
+        index = cls._load_index()
+        if GeoIndex.SEPARATOR in name:
+            node = index.find_label(name)
+        else:
+            node = index.find_exact(name, level)
+            if node is None and level == GeoIndex.CITY:
+                # County names are resolved through their city.
+                node = index.find_exact(name, GeoIndex.COUNTY)
+            if node is None:
+                node = index.find(name, level)
+        if node is None:
+            return None
+        return index.names[index.ancestor(node, ancestor_level)]
+
+    @classmethod
+    def _find(cls, index: GeoIndex, name: str, level: int) -> Optional[int]:
+        if level == GeoIndex.COUNTY and GeoIndex.SEPARATOR in name:
+            return index.find_label(name)
+        return index.find(name, level)
+
+    @classmethod
+    def _load_index(cls) -> GeoIndex:
+        if cls.index is None:
             cls._load_data()
-        cls.province2cities = {}
-        for region, provinces in cls.data.items():
-            for province, cities in provinces.items():
-                cls.province2cities[province] = cities
+            cls.index = GeoIndex.build(cls.data, cls.counties)
+        return cls.index
 
     @classmethod
     def _load_data(cls):
         with open("data/cities_cn.json", "r", encoding="utf-8") as f:
             cls.data = json.load(f)
+        # The county tier is optional, `{province: {city: [county]}}`.
+        if os.path.exists("data/counties_cn.json"):
+            with open("data/counties_cn.json", "r", encoding="utf-8") as f:
+                cls.counties = json.load(f)
@@ -0,0 +1,112 @@
+import threading
+from collections import defaultdict
+from datetime import date as date_type
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from .utils import GeoMap as geo_map
+from .utils import match_weather
+
+
+class View:
+    r"""Materialized answer of one `(location, weather, dates)` query.
+
+    Attributes:
+        result (dict): `{city: {"daily": [...], "link": str}}` of matching
+            cities, with the daily weather restricted to the view dates.
+        structured (dict): The same cities grouped as
+            `{region: {province: {city: weather}}}`.
+    """
+
+    def __init__(self, location: str, weather: str, dates: Tuple[date_type, ...], tier: str = "city"):
+        self.location = location
+        self.weather = weather
+        self.dates = dates
+        self.tier = tier
+        self.result: Dict[str, dict] = {}
+        self.structured: Dict[str, Dict[str, Dict[str, dict]]] = {}
+
+    def update(self, city: str, forecast: dict):
+        """Re-evaluate a single city after its forecast changed."""
+        dates = set(self.dates)
+        daily = [
+            day_weather for day_weather in forecast["daily"]
+            if datetime.strptime(day_weather["date"], "%Y-%m-%d").date() in dates
+        ]
+        region = geo_map.city_to_region(city)
+        province = geo_map.city_to_province(city)
+        if any(match_weather(day_weather["weather"], self.weather) for day_weather in daily):
+            weather = {"daily": daily, "link": forecast["link"]}
+            self.result[city] = weather
+            self.structured.setdefault(region, {}).setdefault(province, {})[city] = weather
+        elif city in self.result:
+            del self.result[city]
+            provinces = self.structured[region]
+            del provinces[province][city]
+            if not provinces[province]:
+                del provinces[province]
+            if not provinces:
+                del self.structured[region]
+
+
+class MaterializedViews:
+    r"""Query results per location and weather, maintained incrementally.
+
+    Every view registers the cities it covers. When the forecast of a city
+    is refreshed, only the views covering that city are updated, so a
+    repeated query is a dictionary lookup that stays consistent with the
+    forecast cache. Views whose last date has passed are dropped on the
+    first `get` or `build` of a day, so a long-running session keeps the
+    views of the current dates only.
+    """
+
+    def __init__(self):
+        self.views: Dict[tuple, View] = {}
+        self.index: Dict[str, set] = defaultdict(set)  #: City to the keys of the views covering it
+        self._lock = threading.RLock()
+        self._expired_on: Optional[date_type] = None  #: Day of the last `expire`
+
+    def get(self, location: str, weather: str, dates: Iterable[date_type], tier: str = "city") -> Optional[View]:
+        self.expire()
+        return self.views.get((location, weather, tuple(dates), tier))
+
+    def build(self, location: str, weather: str, dates: Iterable[date_type], forecasts: Dict[str, dict],
+              tier: str = "city") -> View:
+        """Materialize a view from the forecasts of every city (or county) in the location."""
+        self.expire()
+        key = (location, weather, tuple(dates), tier)
+        view = View(*key)
+        with self._lock:
+            for city, forecast in forecasts.items():
+                view.update(city, forecast)
+                self.index[city].add(key)
+            self.views[key] = view
+        return view
+
+    def update(self, city: str, forecast: dict):
+        """Propagate a refreshed city forecast to the views covering it."""
+        with self._lock:
+            for key in self.index.get(city, ()):
+                self.views[key].update(city, forecast)
+
+    def expire(self, today: Optional[date_type] = None):
+        """Drop the views whose last date is before today, once a day."""
+        today = today or datetime.now().date()
+        if self._expired_on == today:
+            return
+        with self._lock:
+            self._expired_on = today
+            expired = {key for key, view in self.views.items() if view.dates and view.dates[-1] < today}
+            if not expired:
+                return
+            for key in expired:
+                del self.views[key]
+            for city in list(self.index):
+                self.index[city] -= expired
+                if not self.index[city]:
+                    del self.index[city]
+
+    def clear(self):
+        with self._lock:
+            self.views.clear()
+            self.index.clear()
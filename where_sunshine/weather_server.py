@@ -1,6 +1,16 @@
 from typing import Optional, Dict, Union
+from qweather.utils import tracing
 from .utils import format_date
-from datetime import datetime
+from datetime import datetime, time, timedelta
+
+import json
+import math
+import os
+
+# Fields materialized from the QWeather responses, see `qweather.utils.http_client.decode`.
+DAILY_FIELDS = {"fxLink": None, "daily": ["fxDate", "tempMax", "tempMin", "textDay", "iconDay"]}
+HOURLY_FIELDS = {"fxLink": None, "hourly": ["fxTime", "temp", "text"]}
+LOOKUP_FIELDS = {"location": ["id", "name", "lon", "lat"]}
 
 
 class WeatherServer:
@@ -26,6 +36,7 @@ class WeatherServer:
         unit: Optional[str] = None,
         scope: Optional[str] = None,
         api_key: Optional[str] = None,
+        locations_file: Optional[str] = "data/locations_cn.json",
     ):
         r"""
         Initialize the Weather object.
@@ -41,9 +52,21 @@ class WeatherServer:
                 If this parameter is not set, the search scope will be global.
             api_key (Optional[str], optional):
                 The Qweather API key.
+            locations_file (Optional[str], optional):
+                File the city lookups are saved to and loaded from, see
+                `save_locations`. None keeps them in memory only.
         """
         self.daily_weather_client = None  #: QWeather daily weather API client
+        self.hour_weather_client = None  #: QWeather hourly weather API client
+        self.warning_city_list_client = None  #: QWeather warning city list API client
+        self.aqi_client = None  #: QWeather daily AQI API client
+        self.indices_client = None  #: QWeather weather indices API client
+        self.sun_client = None  #: QWeather sunrise and sunset API client
         self.city_lookup_client = None  #: QWeather city lookup API client
+        self.location_ids = {}  #: Cache of `(location, adm)` to `(id, name)`
+        self.location_coordinates = {}  #: Cache of `(location, adm)` to `(lon, lat)`
+        self.locations_file = locations_file
+        self._unsaved = False
 
         self.lang = lang
         self.unit = unit
@@ -56,11 +79,17 @@ class WeatherServer:
             if self.api_key is not None:
                 qweather.api_key = self.api_key
             self.daily_weather_client = qweather.daily_weather_api
+            self.hour_weather_client = qweather.hour_weather_api
+            self.warning_city_list_client = qweather.warning_city_list_api
+            self.aqi_client = qweather.aqi_daily_api
+            self.indices_client = qweather.weather_indices_api
+            self.sun_client = qweather.astronomy_sun_api
             self.city_lookup_client = qweather.city_lookup_api
         except ImportError as e:
             raise ImportError(
                 "Failed to import qweather module. Make sure it is installed."
             ) from e
+        self.load_locations()
 
     def invoke(
         self,
@@ -90,16 +119,19 @@ class WeatherServer:
             Dict: A dictionary containing weather information.
         """
         location_id, location_name = self._get_city_id_name(location, adm)
-        result = self.daily_weather_client.invoke(
-            location=location_id, days=f"{normalize_days(date)}d", lang=self.lang, unit=self.unit
-        )
-        response = {} 
+        with tracing.span("server.forecast", location=location):
+            result = self.daily_weather_client.invoke(
+                location=location_id, days=f"{normalize_days(date)}d", lang=self.lang, unit=self.unit,
+                fields=DAILY_FIELDS,
+            )
+        response = {}
         response["daily"] = [
             {
                 "date": item["fxDate"],
                 "tempMax": item["tempMax"],
                 "tempMin": item["tempMin"],
                 "weather": item["textDay"],
+                "icon": item["iconDay"],
             }
             for item in result["daily"]
         ]
@@ -108,11 +140,113 @@ class WeatherServer:
         response.update({"location": location_name})
         return response
 
+    def hourly(
+        self,
+        location: str,
+        adm: Optional[str] = None,
+        date: Union[int, str] = 1,
+    ) -> Dict:
+        r"""Get hourly weather forecast.
+
+        Args:
+            location (str):
+                The name of the region to be queried, see `invoke`.
+            adm (Optional[str], optional):
+                The higher-level administrative division of a city, see `invoke`.
+            date (Union[int, str]):
+                Date to query weather, see `invoke`. Hourly forecasts cover at
+                most the next 168 hours.
+
+        Returns:
+            Dict: A dictionary containing hourly weather information.
+        """
+        location_id, location_name = self._get_city_id_name(location, adm)
+        with tracing.span("server.forecast", location=location):
+            result = self.hour_weather_client.invoke(
+                location=location_id, hours=f"{normalize_hours(date)}h", lang=self.lang, unit=self.unit,
+                fields=HOURLY_FIELDS,
+            )
+        dates = format_date(date)
+        response = {}
+        response["hourly"] = [
+            {
+                "time": item["fxTime"],
+                "temp": item["temp"],
+                "weather": item["text"],
+            }
+            for item in result["hourly"]
+            if datetime.fromisoformat(item["fxTime"]).date() in dates
+        ]
+        response["link"] = result["fxLink"]
+        response.update({"location": location_name})
+        return response
+
+    def warning_location_ids(self, scope: str = "cn") -> set:
+        """Return the location IDs of every city under a weather warning, in one request."""
+        result = self.warning_city_list_client.invoke(range=scope)
+        return {item["locationId"] for item in result.get("warningLocList", [])}
+
+    def location_id(self, location: str, adm: Optional[str] = None) -> str:
+        """Return the QWeather location ID of a location, looked up once and cached."""
+        return self._get_city_id_name(location, adm)[0]
+
+    def coordinates(self, location: str, adm: Optional[str] = None):
+        """Return `(lon, lat)` of a location, looked up once and cached."""
+        self._get_city_id_name(location, adm)
+        return self.location_coordinates[(location, adm)]
+
+    def load_locations(self):
+        """Load the city lookups saved by `save_locations`."""
+        if self.locations_file is None or not os.path.exists(self.locations_file):
+            return
+        with open(self.locations_file, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        for location, (location_id, name, lon, lat) in saved.items():
+            self.location_ids[(location, None)] = location_id, name
+            self.location_coordinates[(location, None)] = lon, lat
+
+    def save_locations(self):
+        """Save the cached lookups of locations without `adm` to `locations_file`.
+
+        Location IDs and coordinates never change, so a city is looked up
+        once and later processes load it instead of sending a CityLookup
+        request. The file is replaced atomically, as
+        `{location: [id, name, lon, lat]}`.
+        """
+        if self.locations_file is None or not self._unsaved:
+            return
+        self._unsaved = False
+        # Coordinates are cached after the ID, so every key here has both.
+        saved = {
+            location: [*self.location_ids[(location, adm)], *coordinates]
+            for (location, adm), coordinates in list(self.location_coordinates.items())
+            if adm is None
+        }
+        directory = os.path.dirname(self.locations_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.locations_file}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(saved, f, ensure_ascii=False)
+        os.replace(temporary, self.locations_file)
+
     def _get_city_id_name(self, location, adm):
-        resp = self.city_lookup_client.invoke(
-            location=location, adm=adm, scope=self.scope, lang=self.lang
-        )
-        return resp["location"][0]["id"], resp["location"][0]["name"]
+        key = (location, adm)
+        if key not in self.location_ids:
+            name = location
+            if adm is None and "/" in location:
+                # Counties are qualified by their city, e.g. "长春市/朝阳区".
+                adm, name = location.split("/", 1)
+            with tracing.span("server.lookup", location=location):
+                resp = self.city_lookup_client.invoke(
+                    location=name, adm=adm, scope=self.scope, lang=self.lang,
+                    fields=LOOKUP_FIELDS,
+                )
+            city = resp["location"][0]
+            self.location_ids[key] = city["id"], city["name"]
+            self.location_coordinates[key] = float(city["lon"]), float(city["lat"])
+            self._unsaved = True
+        return self.location_ids[key]
 
     def __call__(self, *args, **kwargs):
         return self.invoke(*args, **kwargs)
@@ -131,6 +265,20 @@ def normalize_days(date):
     raise ValueError(f"Invalid date: {date}")
 
 
+def normalize_hours(date):
+    now = datetime.now()
+    date = format_date(date)
+    end = datetime.combine(date[-1] + timedelta(days=1), time.min)
+    delta_hours = math.ceil((end - now).total_seconds() / 3600)
+
+    closest_hours = [24, 72, 168]
+    for hours in closest_hours:
+        if hours >= delta_hours:
+            return hours
+
+    raise ValueError(f"Invalid date: {date}")
+
+
 def extract_days_response(daily_weather, date):
     dates = format_date(date)
     result = []